@@ -54,9 +54,10 @@ class LabelError(vpuError):
         self.colour = 'red'
         
 class LabelNameError(vpuError):
-    def __init__(self,line = 0):
+    def __init__(self,line = 0,word = None):
         self.message = 'Label Name Error'
         self.line = line
+        self.word = word
         self.colour = 'red'
         
 class TooManySteps(vpuError):
@@ -65,43 +66,72 @@ class TooManySteps(vpuError):
         self.num = num
         self.colour = 'red'
         
+class InfiniteLoop(TooManySteps):
+    def __init__(self, num, first, last, lines=(0,0)):
+        """The program came back to a state it had been in, so it will
+        loop forever between the addresses first and last (in the
+        given source lines)."""
+        TooManySteps.__init__(self, num)
+        self.message = 'Infinite loop between lines %d and %d' % lines
+        self.first = first
+        self.last = last
+        self.lines = lines
+
 class vpuLoadError(vpuError):
-    def __init__(self, line):
+    # the word of the source line that is wrong, if known
+    word = None
+    def __init__(self, line, word=None):
         self.line = line
+        self.word = word
         
+class UnresolvedLabels(LabelError, vpuLoadError):
+    def __init__(self, errors):
+        """errors is a list of (line, label) for every operand that
+        could not be resolved, sorted by line."""
+        LabelError.__init__(self, errors[0][0])
+        self.word = errors[0][1]
+        self.errors = errors
+
 class BadArgs(vpuLoadError):
-    def __init__(self,line):
+    def __init__(self,line,word=None):
         self.message = 'Wrong number of arguments'
-        vpuLoadError.__init__(self,line)
+        vpuLoadError.__init__(self,line,word)
         
 class WrongArg(vpuLoadError):
-    def __init__(self,line):
+    def __init__(self,line,word=None):
         self.message = 'Wrong argument'
-        vpuLoadError.__init__(self,line)
+        vpuLoadError.__init__(self,line,word)
         
 class NotInt(vpuLoadError):
-    def __init__(self,line):
+    def __init__(self,line,word=None):
         self.message = 'Integer expected'
-        vpuLoadError.__init__(self,line)
+        vpuLoadError.__init__(self,line,word)
 
 class IllInst(vpuLoadError):
-    def __init__(self,line):
+    def __init__(self,line,word=None):
         self.message = 'Illegal Instruction'
-        vpuLoadError.__init__(self,line)
+        vpuLoadError.__init__(self,line,word)
         
 class IllOperand(vpuLoadError):
-    def __init__(self,line):
+    def __init__(self,line,word=None):
         self.message = 'Illegal Operand'
-        vpuLoadError.__init__(self,line)
+        vpuLoadError.__init__(self,line,word)
 
 class IllReg(vpuLoadError):
-    def __init__(self,line):
+    def __init__(self,line,word=None):
         self.message = 'Illegal Register'
-        vpuLoadError.__init__(self,line)
+        vpuLoadError.__init__(self,line,word)
 
 class FileError(vpuError):
     def __init__(self,line=0):
         self.message = 'File Error'
+
+class BadObject(vpuLoadError):
+    def __init__(self, reason):
+        """An object file that is not one, is damaged, is stale or
+        was made for another kind of processor."""
+        self.message = 'Bad object file (%s)' % reason
+        vpuLoadError.__init__(self, 0)
         
 class MemoryUnderflow(vpuError):
     def __init__(self,add):
@@ -109,6 +139,23 @@ class MemoryUnderflow(vpuError):
         self.add = add
         self.colour = 'red'
 
+class InputError(vpuError):
+    def __init__(self, reason):
+        """Reading the input device when there is no more input, or
+        when the next word is not an integer."""
+        self.message = 'Input Error (%s)' % reason
+        self.colour = 'red'
+
+class TooMuchOutput(vpuError):
+    def __init__(self, limit):
+        """The program wrote more than limit characters."""
+        self.message = 'Too much output (over %d characters)' % limit
+        self.limit = limit
+        self.colour = 'red'
+
+# RAM writes are tracked in pages of 2**PAGEBITS words, see Vpu.snapshot
+PAGEBITS = 6
+
 # zero arg, nonreg, reg, reg reg, nonreg reg, reg nonreg, specials
 inst = (['rtn','halt','nop'], # zero arg
         ['jsr','jump'], # nonreg
@@ -119,6 +166,43 @@ inst = (['rtn','halt','nop'], # zero arg
         ['store','jzero','jnzero','jpos','jneg','storeo'], # reg nonreg
         ['mem','const','string','equ']) #specials
 
-
-
-
+# operands each instruction takes, by its group in inst: 'r' register,
+# 'n' anything else (a number, a label or a constant)
+shapes = ('', 'n', 'r', 'rr', 'nr', 'rn')
+opcodes = {}
+for k in range(len(shapes)):
+    for i in inst[k]:
+        opcodes[i] = shapes[k]
+del k, i
+# the number of every instruction, as the loaded program keeps them
+opnames = opcodes.keys()
+opnames.sort()
+opids = dict([(opnames[k], k) for k in range(len(opnames))])
+del k
+
+# kind of each operand of an instruction: 'r' register, 'p' program
+# address, 'm' memory address, 'o' offset from the frame register
+operands = {'rtn':'', 'halt':'', 'nop':'',
+            'jsr':'p', 'jump':'p',
+            'inc':'r', 'dec':'r', 'zero':'r', 'not':'r', 'jumpi':'r',
+            'push':'r', 'pop':'r',
+            'storei':'rr', 'loadi':'rr', 'storer':'rr', 'add':'rr',
+            'sub':'rr', 'mul':'rr', 'div':'rr', 'mod':'rr', 'and':'rr',
+            'or':'rr', 'xor':'rr',
+            'load':'mr', 'loadn':'mr', 'loado':'or',
+            'store':'rm', 'jzero':'rp', 'jnzero':'rp', 'jpos':'rp',
+            'jneg':'rp', 'storeo':'ro'}
+
+# operand with the register an instruction writes, if any; the stack
+# instructions also write the stack register
+results = {'inc':1, 'dec':1, 'zero':1, 'not':1, 'pop':1,
+           'storer':2, 'loadi':2, 'add':2, 'sub':2, 'mul':2, 'div':2,
+           'mod':2, 'and':2, 'or':2, 'xor':2,
+           'load':2, 'loadn':2, 'loado':2}
+stack = ['push', 'pop', 'jsr', 'rtn']
+
+# memory an instruction writes to: 'a' the address in an operand, 'r'
+# the address in a register operand, 'o' the frame register plus an
+# offset operand, 's' the new top of the stack
+stores = {'store':('a',2), 'storei':('r',2), 'storeo':('o',2),
+          'push':('s',0), 'jsr':('s',0)}
@@ -19,15 +19,20 @@ with this program; if not, write to the Free Software Foundation, Inc.,
 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 """
 
-import os, sys
-import ConfigParser
+import os, sys, time
+started = time.time()  # see mark()
 import gtk, pango, gobject
 
 from vpu import *
 from constants import *
+from vpu_cache import ImageCache
+from vpu_console import Console, LIMIT
 
 VERSION = "2.1.0"
 
+# programs assembled, by their text
+images = ImageCache()
+
 # Definitions (non-configurable)
 APOO_CONFIG_FILE = os.path.join (os.environ.get("HOME"), ".apoo")
 DOCS_PATH = "/usr/share/doc/apoo/"
@@ -41,12 +46,15 @@ DOC_ASSEMBLY = "help_assembly"
 
 # Configurable (via arguments):
 test_mode = False  # --tester
+timing = False     # --timing
+input_lines = ()   # --input, what programs read before they ask
 
 # Configurable (via the preferences dialog):
 # (up-case are variables we don't touch, so we know the defaults.)
 REGISTERS_NB = registers_nb = 8
 RAM_SIZE     = ram_size     = 1000
 MAX_STEPS    = max_steps    = 1000   # to cut on infinite loops
+HISTORY_SIZE = history_size = 100000 # steps that can be undone
 INPUT_OUTPUT = input_output = 50001  # magic numbers
 OUTPUT_ASCII = output_ascii = 50000
 OUTPUT_CR    = output_cr    = 50010
@@ -56,6 +64,9 @@ default_dir = None
 MIRROR_MEMORY = mirror_memory = "no"  # "hor", "ver" or "no"
 
 # Utilities
+def mark (name):  # startup breakpoint, written with --timing
+	if timing:
+		sys.stderr.write ("%8.3fs %s\n" % (time.time() - started, name))
 def digits_on (nb):  # returns the digits of a number (eg. 250 => 3)
     if nb < 10: return 1
     return digits_on (nb / 10) + 1
@@ -92,6 +103,15 @@ def get_tone_color (style, tone):
 def get_color (red, green, blue):
 	return gtk.gdk.Color (red << 8, green << 8, blue << 8, 0)
 
+# the help documents, read when first shown
+docs = {}
+def read_doc (path, filename):
+	if not docs.has_key (filename):
+		file = open (path+filename + ".txt", 'r')
+		docs[filename] = file.read()
+		file.close()
+	return docs[filename]
+
 ## Our own widgets
 
 # Extends GtkTextBuffer to add some basic functionality:
@@ -873,6 +893,7 @@ gobject.type_register (RatioHBox)
 
 # The setup dialog
 def read_config():
+	import ConfigParser
 	config = ConfigParser.ConfigParser ()
 	config.read (APOO_CONFIG_FILE)
 
@@ -882,13 +903,15 @@ def read_config():
 	if config.has_option ("appearance", "memory-mirror"):
 		mirror_memory = config.get ("appearance", "memory-mirror")
 
-	global registers_nb, ram_size, max_steps, input_output, output_ascii, output_cr
+	global registers_nb, ram_size, max_steps, history_size, input_output, output_ascii, output_cr
 	if config.has_option ("vpu", "registers-nb"):
 		registers_nb = config.getint ("vpu", "registers-nb")
 	if config.has_option ("vpu", "ram-size"):
 		ram_size = config.getint ("vpu", "ram-size")
 	if config.has_option ("vpu", "max-steps"):
 		max_steps = config.getint ("vpu", "max-steps")
+	if config.has_option ("vpu", "history-size"):
+		history_size = config.getint ("vpu", "history-size")
 	if config.has_option ("vpu", "input-output-mem"):
 		input_output = config.getint ("vpu", "input-output-mem")
 	if config.has_option ("vpu", "output-ascii-mem"):
@@ -901,6 +924,7 @@ def read_config():
 		default_dir = config.get ("session", "default-dir")
 
 def write_config():
+	import ConfigParser
 	config = ConfigParser.ConfigParser ()
 
 	config.add_section ("appearance")
@@ -911,6 +935,7 @@ def write_config():
 	config.set ("vpu", "registers-nb", int (registers_nb))
 	config.set ("vpu", "ram-size", int (ram_size))
 	config.set ("vpu", "max-steps", int (max_steps))
+	config.set ("vpu", "history-size", int (history_size))
 	config.set ("vpu", "input-ouput-mem", int (input_output))
 	config.set ("vpu", "output-ascii-mem", int (output_ascii))
 	config.set ("vpu", "output-cr-mem", int (output_cr))
@@ -976,6 +1001,7 @@ class Preferences (gtk.Dialog):
 		self.regs_entry = DigitEntry (False, registers_nb)
 		self.ram_entry = DigitEntry (False, ram_size)
 		self.steps_entry = DigitEntry(False, max_steps)
+		self.history_entry = DigitEntry (False, history_size)
 		self.in_out_entry = DigitEntry (False, input_output)
 		self.ascii_out_entry = DigitEntry (False, output_ascii)
 		self.cr_out_entry = DigitEntry (False, output_cr)
@@ -983,6 +1009,7 @@ class Preferences (gtk.Dialog):
 		self.regs_entry.connect_after ("changed", self.regs_changed_cb)
 		self.ram_entry.connect_after ("changed", self.ram_changed_cb)
 		self.steps_entry.connect_after ("changed", self.steps_changed_cb)
+		self.history_entry.connect_after ("changed", self.history_changed_cb)
 		self.in_out_entry.connect_after ("changed", self.in_out_changed_cb)
 		self.ascii_out_entry.connect_after ("changed", self.ascii_out_changed_cb)
 		self.cr_out_entry.connect_after ("changed", self.cr_out_changed_cb)
@@ -990,7 +1017,8 @@ class Preferences (gtk.Dialog):
 		cpu_grid = self.create_grid ("Machine Processor",
 			[ ("_Number of registers", self.regs_entry),
 			  ("_RAM size", self.ram_entry),
-			  ("_Maximum steps", self.steps_entry) ] )
+			  ("_Maximum steps", self.steps_entry),
+			  ("_History size", self.history_entry) ] )
 		mem_grid = self.create_grid ("Memory Mapping",
 			[ ("_Integer input/output", self.in_out_entry),
 			  ("_ASCII output", self.ascii_out_entry),
@@ -1048,6 +1076,7 @@ class Preferences (gtk.Dialog):
 			self.regs_entry.set_value (REGISTERS_NB)
 			self.ram_entry.set_value (RAM_SIZE)
 			self.steps_entry.set_value (MAX_STEPS)
+			self.history_entry.set_value (HISTORY_SIZE)
 			self.in_out_entry.set_value (INPUT_OUTPUT)
 			self.ascii_out_entry.set_value (OUTPUT_ASCII)
 			self.cr_out_entry.set_value (OUTPUT_CR)
@@ -1067,6 +1096,11 @@ class Preferences (gtk.Dialog):
 		max_steps = entry.get_value()
 		return False
 
+	def history_changed_cb (self, entry):
+		global history_size
+		history_size = entry.get_value()
+		return False
+
 	def in_out_changed_cb (self, entry):
 		global input_output
 		input_output = entry.get_value()
@@ -1114,7 +1148,8 @@ class Preferences (gtk.Dialog):
 			mirror_memory = "ver"
 		for i in windows:
 			for j in i.notebook.get_children():
-				j.create_memory_table()
+				if j.lists_built:
+					j.create_memory_table()
 
 	# to cut down on code size
 	def create_frame (self, title, widget):
@@ -1473,9 +1508,10 @@ class VpuModel:
 		def set_reg_scroll (self, path): pass
 		def set_output_buffer (self, buffer): pass
 		def set_program_counter (self, value): pass
-		def set_timer_counter (self, value): pass
+		def set_timer_counter (self, value, steps = 0): pass
 		def set_message (self, message, status, color): pass
 		def get_program_code (self): pass
+		def get_program_text (self): pass
 
 	def __init__ (self, listener):
 		self.listener = listener
@@ -1483,23 +1519,30 @@ class VpuModel:
 		self.reg_model = None
 
 	def load (self):
-		self.vpu = Vpu (registers_nb,
-		                { output_ascii:("val = 0", "self.Inter.output_inst (val, True)"),
-		                  input_output:("val = self.Inter.input_inst()",
-		                                "self.Inter.output_inst (val)"),
-		                  output_cr:("val = 0", "self.Inter.output_inst()") }, self,
-		                ram_size)
+		self.vpu = Vpu (registers_nb, {}, self, ram_size)
+		self.console = Console (input_lines, None, LIMIT, self.input_inst)
+		self.console.map (self.vpu, output_ascii, input_output, output_cr)
 		self.vpu.last_reg = self.vpu.reg
 		self.vpu.mem_changed = []
 		self.vpu.reg_changed = []
 		self.vpu.last_mem_changed = []
 		self.vpu.last_reg_changed = []
 
-		program = self.listener.get_program_code()
 		try:
-			self.vpu.load (program)
+			# loading the same text again does not parse it again
+			images.load (self.vpu, self.listener.get_program_text(),
+			             self.listener.get_program_code)
 		except vpuLoadError,error:
-			message = "Parsing Error (Ln %d): %s" % (error.line, error.message)
+			lines = self.listener.get_program_text().splitlines()
+			column = 0
+			if 0 < error.line <= len (lines):
+				column = wordColumn (lines[error.line-1], error)
+			if column:
+				message = "Parsing Error (Ln %d, Col %d): %s" % (error.line, column, error.message)
+			else:
+				message = "Parsing Error (Ln %d): %s" % (error.line, error.message)
+			if isinstance (error, UnresolvedLabels):
+				message += " (%s)" % ", ".join ([label for (line, label) in error.errors])
 			self.listener.set_message (message, "parsing error", "red", error.line)
 			return False
 		except:
@@ -1507,6 +1550,9 @@ class VpuModel:
 			self.listener.set_message (message, "parsing error", "red")
 			return False
 
+		self.image = self.vpu.snapshot()
+		self.vpu.record (True, max (history_size, 1))
+		self.vpu.trackCalls()
 		self.listener.set_message ("Program Loaded", "loaded", "white")
 		self.ram_model = VpuModel.RamModel (self.vpu)
 		self.reg_model = VpuModel.RegModel (self.vpu)
@@ -1529,7 +1575,21 @@ class VpuModel:
 		self.listener.set_timer_counter (0)
 		self.vpu = None
 
+	def reset (self):
+		if self.ram_model == None: return  # not loaded
+		self.vpu.restore (self.image)
+		self.vpu.last_reg = self.vpu.reg[:]
+		self.vpu.mem_changed = []
+		self.vpu.reg_changed = []
+		self.vpu.last_mem_changed = []
+		self.vpu.last_reg_changed = []
+		self.console.reset (input_lines)
+		self.output_buffer.set_text ("")
+		self.listener.set_message ("Program Reset", "loaded", "white")
+		self.sync()
+
 	def sync (self):
+		self.show_output()
 		self.ram_model.sync()
 		self.reg_model.sync()
 		if len (self.vpu.mem_changed) > 0:
@@ -1538,7 +1598,8 @@ class VpuModel:
 			self.listener.set_reg_scroll ((self.vpu.reg_changed[0],))
 
 		self.listener.set_program_counter (self.vpu.PC)
-		self.listener.set_timer_counter (self.vpu.time)
+		seconds, steps = self.vpu.timing()
+		self.listener.set_timer_counter (seconds, steps)
 
 	def advance (self, steps_nb, honor_breakpoint):
 		if self.ram_model == None: return  # not loaded
@@ -1547,68 +1608,65 @@ class VpuModel:
 		self.vpu.last_mem_changed = self.vpu.mem_changed[:]
 		self.vpu.last_reg_changed = self.vpu.reg_changed[:]
 
-		step = 0
-		while True:
-			self.vpu.last_reg = self.vpu.reg[:]
-			self.vpu.mem_changed = []
-			self.vpu.reg_changed = []
+		journal = self.vpu.advance (steps_nb, honor_breakpoint, max_steps)
+		error = journal.error
+		if isinstance (error, OutOfMemory):
+			message = "%s: memory address %s not reserved" % (error.message, error.add)
+			self.listener.set_message (message + self._where (error), "end of program", error.colour)
+		elif isinstance (error, vpuError):
+			self.listener.set_message (error.message + self._where (error), "end of program", error.colour)
+		elif error != None:
+			message = "Error: %s, %s" % (error.__class__, error)
+			self.listener.set_message (message, "end of program error", "red")
+		elif journal.stop == 'break':
+			self.listener.set_message ("Continue Program", "at break point", "white")
+		else:
+			self.listener.set_message ("Next Step", "running", "white")
+		self._show_journal (journal)
 
-			try:
-				mem_changed = self.vpu.step()
-				if mem_changed != (None, None) and not mem_changed[0] in self.vpu.mem_changed:
-					self.vpu.mem_changed.append (mem_changed[0])
-				if step > max_steps:
-					raise TooManySteps (step)
-			except OutOfMemory, error:
-				message = "%s: memory address %s not reserved" % (error.message, error.add)
-				self.message.write (message, "end of program", error.colour)
-			except vpuError, error:
-				self.listener.set_message (error.message, "end of program", error.colour)
-			except:
-				message = "Error: %s, %s" % (sys.exc_type, sys.exc_value)
-				self.listener.set_message (message, "end of program error", "red")
-			else:
-				if step != -1:
-					step += 1
-					if step == steps_nb:
-						self.listener.set_message ("Next Step", "running", "white")
-						break
-				if honor_breakpoint and self._is_on_breakpoint():
-					self.listener.set_message ("Continue Program", "at break point", "white")
-					break
-				continue
-			break
+	def back (self, steps_nb, honor_breakpoint):
+		if self.ram_model == None: return  # not loaded
+		self.vpu.last_mem_changed = self.vpu.mem_changed[:]
+		self.vpu.last_reg_changed = self.vpu.reg_changed[:]
 
-		# vpu.mem_changed set while stepping; similar procedure for registers
-		for i in xrange (self.vpu.nreg):
-			if self.vpu.reg[i] != self.vpu.last_reg[i]:
-				self.vpu.reg_changed.append (i)
+		if honor_breakpoint:
+			journal = self.vpu.contBack()
+		else:
+			journal = self.vpu.back (steps_nb)
+		if journal.stop == 'break':
+			self.listener.set_message ("Back at break point", "at break point", "white")
+		elif journal.stop == 'start':
+			self.listener.set_message ("No earlier steps recorded", "start of history", "white")
+		else:
+			self.listener.set_message ("Previous Step", "running", "white")
+		self._show_journal (journal)
+
+	def _where (self, error):
+		# innermost subroutine active when error was raised
+		trace = self.vpu.backtrace (error)
+		if len (trace) == 0 or isinstance (error, EndOfProgram):
+			return ""
+		name, line = trace[-1]
+		return " (in %s, called from line %d, depth %d)" % (name, line, len (trace))
+
+	def _show_journal (self, journal):
+		# the journal has the registers and memory touched by the whole batch
+		self.vpu.last_reg = self.vpu.reg[:]
+		for i in journal.regs:
+			self.vpu.last_reg[i] = journal.regs[i][0]
+		self.vpu.mem_changed = journal.mem.keys()
+		self.vpu.reg_changed = [i for i in journal.regs if journal.regs[i][0] != journal.regs[i][1]]
 		self.sync()
 
-	def _is_on_breakpoint (self):
-		try:
-			line = self.vpu.lines [self.vpu.PC]
-			try:
-				i = self.vpu.lines.index (line)
-			except ValueError:
-				return False
-			try:
-				b = self.vpu.BreakP.index (i)
-			except ValueError:
-				return False
-			return True
-		except IndexError:
-			return False
-
 	# graphical-dependent instructions
-	def output_inst (self, value = '\n', convert_ascii = False):
-		if convert_ascii:
-			value = ("%c" % value).decode()
-			# TODO: validate the string to see whether it is representable
-		buffer = self.output_buffer
-		buffer.insert (buffer.get_end_iter(), "%s" % value)
+	def show_output (self):  # what the program wrote since last shown
+		text = self.console.take()
+		if text:
+			buffer = self.output_buffer
+			buffer.insert (buffer.get_end_iter(), text.decode ("latin-1"))
 
 	def input_inst (self):
+		self.show_output()  # so that what is asked is seen
 		dialog = gtk.Dialog ("Insert Input", self.listener.get_toplevel(),
 		                     gtk.DIALOG_MODAL | gtk.DIALOG_DESTROY_WITH_PARENT,
 		                     (gtk.STOCK_OK, gtk.RESPONSE_ACCEPT))
@@ -1680,20 +1738,75 @@ class Interface (gtk.VBox, VpuModel.Listener):
 		self.run_button = gtk.Button ("_Run")
 		self.step_button = ButtonWithSpin ("_Step")
 		self.continue_button = gtk.Button ("_Continue")
+		self.step_back_button = ButtonWithSpin ("Step _Back")
+		self.continue_back_button = gtk.Button ("Continue Bac_k")
 		self.clear_button = gtk.Button ("Cle_ar")
+		self.reset_button = gtk.Button ("Rese_t")
 
 		self.load_button.connect  ("clicked", self.load_button_cb)
 		self.run_button.connect   ("clicked", self.run_button_cb)
 		self.step_button.connect  ("clicked", self.step_button_cb)
 		self.continue_button.connect ("clicked", self.continue_button_cb)
+		self.step_back_button.connect ("clicked", self.step_back_button_cb)
+		self.continue_back_button.connect ("clicked", self.continue_back_button_cb)
 		self.clear_button.connect ("clicked", self.clear_button_cb)
+		self.reset_button.connect ("clicked", self.reset_button_cb)
 
 		buttons_box.pack_start (self.load_button)
 		buttons_box.pack_start (self.run_button)
 		buttons_box.pack_start (self.step_button)
 		buttons_box.pack_start (self.continue_button)
+		buttons_box.pack_start (self.step_back_button)
+		buttons_box.pack_start (self.continue_back_button)
 		buttons_box.pack_start (self.clear_button)
+		buttons_box.pack_start (self.reset_button)
 
+		set_monospace_font (self.editor)
+
+		# Message label
+		self.message = MessageLabel()
+
+		# so we can set a border to it
+		message_box = gtk.EventBox()
+		message_box.add (self.message)
+		message_box.set_border_width (6)
+
+		# Layout
+		editor_buttons_box = gtk.HBox (False, 12)
+		editor_buttons_box.pack_start (editor_box, expand = True)
+		editor_buttons_box.pack_start (buttons_box, expand = False)
+		editor_buttons_box.set_border_width (6)
+
+		self.editor_lists_pane = gtk.VPaned()
+		self.editor_lists_pane.pack1 (editor_buttons_box, True, False)
+		# the lists are built when the page is first shown (see build_lists)
+		self.informations_box = gtk.VBox (False, 12)
+		self.informations_box.set_border_width (6)
+		self.lists_built = False
+		self.connect ("map", self.map_cb)
+		self.editor_lists_pane.pack2 (self.informations_box, True, False)
+		self.editor_lists_pane.connect ("size-allocate", self.pane_size_allocate_cb, None)
+		self.first_allocate = True
+
+		# main_box usage is to have a border around the widgets
+		self.pack_start (self.editor_lists_pane, expand = True)
+		self.pack_start (message_box, expand = False)
+
+		self.file_read (filename)
+		self.vpu.clear()
+		self.show_all()
+		mark ("editor of " + str (filename))
+
+	# The output, registers and memory lists, with the program counter and
+	# timer, are only built after the page is first shown, so that the
+	# editor gets painted first; until then the listener calls below only
+	# reach the editor, and build_lists picks the vpu model state up.
+	def map_cb (self, widget):
+		if not self.lists_built:
+			gobject.idle_add (self.build_lists)
+
+	def build_lists (self):
+		if self.lists_built: return False
 		# Informative entries (Program counter & timer)
 		self.counter, counter_box = self.create_informative ("_Program Counter")
 		self.timer, timer_box = self.create_informative ("_Timer")
@@ -1707,7 +1820,6 @@ class Interface (gtk.VBox, VpuModel.Listener):
 
 		# Output text
 		self.output = gtk.TextView()
-		set_monospace_font (self.editor)
 		self.output.set_editable (False)
 		self.output.set_cursor_visible (False)
 		self.output.set_size_request (40, -1)
@@ -1759,43 +1871,28 @@ class Interface (gtk.VBox, VpuModel.Listener):
 		self.memory_box = gtk.EventBox()
 		self.create_memory_table()
 
-		# Message label
-		self.message = MessageLabel()
-
-		# so we can set a border to it
-		message_box = gtk.EventBox()
-		message_box.add (self.message)
-		message_box.set_border_width (6)
-
-		# Layout
-		editor_buttons_box = gtk.HBox (False, 12)
-		editor_buttons_box.pack_start (editor_box, expand = True)
-		editor_buttons_box.pack_start (buttons_box, expand = False)
-		editor_buttons_box.set_border_width (6)
-
 		lists_box = RatioHBox (12)
 		lists_box.pack (output_box, 1)
 		lists_box.pack (registers_box, 1)
 		lists_box.pack (self.memory_box, 2)
 
-		informations_box = gtk.VBox (False, 12)
-		informations_box.pack_start (informative_box, expand = False)
-		informations_box.pack_start (lists_box, expand = True)
-		informations_box.set_border_width (6)
-
-		self.editor_lists_pane = gtk.VPaned()
-		self.editor_lists_pane.pack1 (editor_buttons_box, True, False)
-		self.editor_lists_pane.pack2 (informations_box, True, False)
-		self.editor_lists_pane.connect ("size-allocate", self.pane_size_allocate_cb, None)
-		self.first_allocate = True
-
-		# main_box usage is to have a border around the widgets
-		self.pack_start (self.editor_lists_pane, expand = True)
-		self.pack_start (message_box, expand = False)
-
-		self.file_read (filename)
-		self.vpu.clear()
-		self.show_all()
+		self.informations_box.pack_start (informative_box, expand = False)
+		self.informations_box.pack_start (lists_box, expand = True)
+		self.informations_box.show_all()
+		self.lists_built = True
+
+		# show what the vpu model has now
+		self.set_ram_model (self.vpu.ram_model)
+		self.set_reg_model (self.vpu.reg_model)
+		self.set_output_buffer (self.vpu.output_buffer)
+		if self.vpu.vpu != None:
+			self.counter.set_text (str (self.vpu.vpu.PC))
+			self.set_timer_counter (*self.vpu.vpu.timing())
+		else:
+			self.counter.set_text ("0")
+			self.set_timer_counter (0)
+		mark ("lists of " + str (self.filename))
+		return False
 
 	def pane_size_allocate_cb (self, widget, alloc, _data):
 		# we can't set ratios on the pane sides, so we tune it at first allocate
@@ -1943,7 +2040,10 @@ class Interface (gtk.VBox, VpuModel.Listener):
 		self.run_button.set_sensitive (not editable)
 		self.step_button.set_sensitive (not editable)
 		self.continue_button.set_sensitive (not editable)
+		self.step_back_button.set_sensitive (not editable)
+		self.continue_back_button.set_sensitive (not editable)
 		self.clear_button.set_sensitive (not editable)
+		self.reset_button.set_sensitive (not editable)
 
 		if self.main_parent != None:
 			self.main_parent.load_menu_sensitive()
@@ -1958,57 +2058,43 @@ class Interface (gtk.VBox, VpuModel.Listener):
 
 	# cuts text into a list of instructions, like [(1, ["x", "rtn", "R2"]), ...]
 	def get_program_code (self):
-		buffer = self.editor.get_buffer()
-		program = []
-		line = 0
-		while line < buffer.get_line_count():
-			splits = buffer.split_line (line)
-			line += 1
-			if splits == None: break
-			if len (splits) == 0: continue
-			word = splits[0].word
-			if splits[0].word[0] == '#':
-				continue
-			linep = []
-			if word[-1] == ':':
-				linep.append (word[:-1])
-			else:
-				linep.append ([])
-				linep.append (word)
-			for i in xrange (1, len (splits)):
-				word = splits[i].word
-				if word[0] == '#':
-					break
-				else:
-					linep.append (word)
-			program.append ((line, linep))
-		return program
+		return ParseProgram (self.get_program_text().splitlines (True))
+
+	def get_program_text (self):
+		return self.editor.get_text()
 
 	def set_ram_model (self, model):
+		if not self.lists_built: return
 		for i in self.memory:
 			i.set_model (model)
 	def set_reg_model (self, model):
+		if not self.lists_built: return
 		self.registers.set_model (model)
 
 	def set_ram_scroll (self, path):
+		if not self.lists_built: return
 		self.memory[-1].scroll_to_cell (path)
 	def set_reg_scroll (self, path):
+		if not self.lists_built: return
 		self.registers.scroll_to_cell (path)
 
 	def set_output_buffer (self, buffer):
+		if not self.lists_built: return
 		if buffer == None:
 			buffer = gtk.TextBuffer()
 		self.output.set_buffer (buffer)
 
 	def set_program_counter (self, value):
-		self.counter.set_text (str (value))
+		if self.lists_built:
+			self.counter.set_text (str (value))
 		# set current line to the VPU one
 		try: line = self.vpu.vpu.lines [value]
 		except: pass
 		else:
 			self.editor.mode.set_current_line (line)
-	def set_timer_counter (self, value):
-		self.timer.set_text (str (value))
+	def set_timer_counter (self, value, steps = 0):
+		if not self.lists_built: return
+		self.timer.set_text ("%.3fs (%d)" % (value, steps))
 
 	def set_message (self, text, status, color, line = -1):
 		self.message.write (text, color)
@@ -2030,6 +2116,13 @@ class Interface (gtk.VBox, VpuModel.Listener):
 		self.vpu.advance (button.get_value(), False)
 	def continue_button_cb (self, button):
 		self.vpu.advance (-1, True)
+	def step_back_button_cb (self, button):
+		self.vpu.back (button.get_value(), False)
+	def continue_back_button_cb (self, button):
+		self.vpu.back (-1, True)
+
+	def reset_button_cb (self, button):
+		self.vpu.reset()
 
 	def clear_button_cb (self, button):
 		self.editor.breakpoints = []
@@ -2478,9 +2571,7 @@ class Window (gtk.Window):
 		dialog.set_default_size (-1, 450)
 
 		buffer = gtk.TextBuffer()
-		file = open (path+filename + ".txt", 'r')
-		buffer.set_text (file.read())
-		file.close()
+		buffer.set_text (read_doc (path, filename))
 
 		view = gtk.TextView (buffer)
 		view.set_editable (False)
@@ -2637,24 +2728,16 @@ class Window (gtk.Window):
 		self.menu_edit_items = []
 
 		file_menu = gtk.Menu()
-		item = self.add_menu_item (self.menu, "_File")
-		item.set_submenu (file_menu)
+		file_item = self.add_menu_item (self.menu, "_File")
+		file_item.set_submenu (file_menu)
 		if not test_mode:
 			self.add_menu_item (file_menu, "_New", gtk.STOCK_NEW, self.file_new_cb)
 			self.add_menu_item (file_menu, "_Open", gtk.STOCK_OPEN, self.file_open_cb)
 			if gtk.pygtk_version >= (2,10,0):
-				manager = gtk.recent_manager_get_default()
-				recents_menu = gtk.RecentChooserMenu (manager)
-				recents_menu.set_show_numbers (True)
-				recents_menu.set_local_only (True)
-				recents_menu.set_sort_type (gtk.RECENT_SORT_MRU)
-				recents_menu.set_limit (10)
-				filter = gtk.RecentFilter()
-				filter.add_pattern ("*.apoo")
-				recents_menu.set_filter (filter)
+				# the recent files are only looked up when the menu is opened
 				item = self.add_menu_item (file_menu, "Open _Recent")
-				item.set_submenu (recents_menu)
-				recents_menu.connect ("item-activated", self.file_open_recent_cb)
+				item.set_submenu (gtk.Menu())
+				file_item.connect ("activate", self.load_recents_menu, item)
 			self.add_menu_item (file_menu, "-")
 			self.add_menu_item (file_menu, "_Save", gtk.STOCK_SAVE, self.file_save_cb,
 				group = self.menu_page_items)
@@ -2725,6 +2808,20 @@ class Window (gtk.Window):
 		self.menu.show_all()
 
 	# convience methods to create the menu to cut down on code
+	def load_recents_menu (self, file_item, item):
+		if isinstance (item.get_submenu(), gtk.RecentChooserMenu): return
+		manager = gtk.recent_manager_get_default()
+		recents_menu = gtk.RecentChooserMenu (manager)
+		recents_menu.set_show_numbers (True)
+		recents_menu.set_local_only (True)
+		recents_menu.set_sort_type (gtk.RECENT_SORT_MRU)
+		recents_menu.set_limit (10)
+		filter = gtk.RecentFilter()
+		filter.add_pattern ("*.apoo")
+		recents_menu.set_filter (filter)
+		item.set_submenu (recents_menu)
+		recents_menu.connect ("item-activated", self.file_open_recent_cb)
+
 	def add_menu_item (self, parent, label, image = None, callback = None,
 	                   shortcut = None, group = None):  # shortcut = (modified, key)
 		if label == '-':
@@ -2774,10 +2871,24 @@ if __name__ == "__main__":
 		if argv[i] == "--tester" or argv[i] == "-t":
 			test_mode = True
 
+		elif argv[i][:8] == "--input=":
+			try:
+				file = open (argv[i][8:], 'r')
+				input_lines = file.readlines()
+				file.close()
+			except IOError:
+				print "Cannot read the input file " + argv[i][8:]
+				sys.exit (1)
+
+		elif argv[i] == "--timing":
+			timing = True
+
 		elif argv[i] == "--help" or argv[i] == "-h":
 			print "Usage: " + argv[0] + " [OPTIONS] [FILENAME]"
 			print "Options may be:"
 			print "\t--tester, -t\tExecute-only mode"
+			print "\t--input=FILE\tRead the program input from FILE"
+			print "\t--timing\tReport the startup times"
 			print "\t--help, -h\tShow this help text"
 			print ""
 			sys.exit (0)
@@ -2794,9 +2905,16 @@ if __name__ == "__main__":
 		sys.exit (1)
 
 	# go on, now
+	mark ("imports")
 	read_config()
+	mark ("configuration")
 
 	Window (filenames)
+	mark ("window")
+	if timing:
+		# idles of this priority run once what was shown has been painted
+		gobject.idle_add (lambda: mark ("first paint"),
+		                  priority = gobject.PRIORITY_HIGH_IDLE + 30)
 	gtk.main()
 
 	write_config()
@@ -22,24 +22,181 @@ Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
 @author: Rogério Reis & Nelma Moreira {rvr,nam}@ncc.up.pt
 """
 from constants import *
-import string, sys, time, copy
+import string, sys, re
+from array import array
+from functools import partial
+from vpu_blocks import BlockTier
+from vpu_history import History
+from vpu_profile import Profiler, CallStack
+from vpu_loops import LoopDetector
 
 
 __version = "3.0p2"
-Changed = (None,None)
+
+# clock for the timers: the finest wall clock of the platform, which
+# is time.clock on Windows and time.time (not monotonic) elsewhere
+from timeit import default_timer as clock
+
+# word sizes: array typecode and wraparound of the results
+def wrap16(v):
+    return ((v + 0x8000) & 0xFFFF) - 0x8000
+
+def wrap32(v):
+    return ((v + 0x80000000) & 0xFFFFFFFFL) - 0x80000000
+
+def nowrap(v):
+    return v
+
+words = {None:(None, nowrap), 16:('h', wrap16), 32:('i', wrap32)}
+
+
+class Journal:
+    """What a call to Vpu.advance did: steps is the number of
+    instructions executed, regs and mem map every register and RAM
+    address written to its (first, last) values, stop tells why it
+    stopped ('steps', 'break' or 'error') and error is the exception
+    that stopped it, if any.  Vpu.back and Vpu.contBack return them
+    too, with the steps undone, only the values that changed and
+    'start' as stop when the history ran out."""
+    def __init__(self):
+        self.steps = 0
+        self.regs = {}
+        self.mem = {}
+        self.stop = None
+        self.error = None
+
+class Program:
+    """A loaded program kept as parallel arrays, one entry per
+    instruction: opcode has its number (see constants.opids), operand1
+    and operand2 its operands, already resolved to numbers, or 0.
+    Indexing it gives the instruction as a tuple, like ('jzero', 1, 12),
+    and it can be changed the same way; slicing it gives a list of
+    them."""
+    def __init__(self, instructions=()):
+        self.opcode = array('B')
+        self.operand1 = array('l')
+        self.operand2 = array('l')
+        for i in instructions:
+            self.append(i)
+
+    def append(self, i):
+        self.opcode.append(opids[i[0]])
+        self.operand1.append(0)
+        self.operand2.append(0)
+        self[len(self.opcode) - 1] = i
+
+    def __len__(self):
+        return len(self.opcode)
+
+    def __getitem__(self, pc):
+        if isinstance(pc, slice):
+            return [self[k] for k in range(*pc.indices(len(self.opcode)))]
+        code = self.opcode[pc]
+        n = arities[code]
+        if n == 0:
+            return (opnames[code],)
+        elif n == 1:
+            return (opnames[code], self.operand1[pc])
+        return (opnames[code], self.operand1[pc], self.operand2[pc])
+
+    def __setitem__(self, pc, i):
+        self.opcode[pc] = opids[i[0]]
+        for k, operand in [(1, self.operand1), (2, self.operand2)]:
+            if len(i) > k:
+                try:
+                    operand[pc] = i[k]
+                except OverflowError:
+                    # numbers too big for an array, when words are
+                    # unbounded
+                    self.widen()
+                    self[pc] = i
+                    return
+
+    def __iter__(self):
+        for pc in range(len(self.opcode)):
+            yield self[pc]
+
+    def widen(self):
+        self.operand1 = list(self.operand1)
+        self.operand2 = list(self.operand2)
+
+    def name(self, pc):
+        """The name of the instruction at pc"""
+        return opnames[self.opcode[pc]]
+
+    def copy(self):
+        new = Program()
+        new.opcode = self.opcode[:]
+        new.operand1 = self.operand1[:]
+        new.operand2 = self.operand2[:]
+        return new
+
+# what link needs of every instruction, by its number
+arities = [len(opcodes[name]) for name in opnames]
+resultOperand = [results.get(name) for name in opnames]
+onStack = [name in stack for name in opnames]
+storeOperand = [stores.get(name) for name in opnames]
+
+class Snapshot:
+    """A copy of everything Vpu.load sets up, taken by Vpu.snapshot
+    and given back to Vpu.restore."""
+    def __init__(self, vpu):
+        self.reg = vpu.reg[:]
+        self.RAM = vpu.RAM[:]
+        self.PC = vpu.PC
+        self.Prog = vpu.Prog.copy()
+        self.fixups = vpu.fixups[:]
+        self.lines = vpu.lines[:]
+        self.labelp = vpu.labelp.copy()
+        self.labelm = vpu.labelm.copy()
+        self.labelms = vpu.labelms.copy()
+        self.constants = vpu.constants.copy()
+        self.StaticMem = vpu.StaticMem
+        self.time, self.steps = vpu.time, vpu.steps
+        self.layout = vpu.layout
+
+class Device:
+    """A memory mapped device, see Vpu.mapDevice. Reading one of its
+    addresses calls load and writing calls store, both with the
+    processor and the address being accessed."""
+    def load(self, vpu, add):
+        return 0
+
+    def store(self, vpu, add, val):
+        pass
+
+class ExecDevice(Device):
+    """A device given, as in the old MpMem dictionaries, by a pair of
+    Python statements for load and store: they find the processor in
+    self, the address in add and the value in val, which the load
+    statement must set."""
+    def __init__(self, code):
+        self.code = (compile(code[0], "<mapped load>", "exec"),
+                     compile(code[1], "<mapped store>", "exec"))
+
+    def load(self, vpu, add):
+        env = {'self':vpu, 'add':add, 'val':0}
+        exec self.code[0] in globals(), env
+        return env['val']
+
+    def store(self, vpu, add, val):
+        exec self.code[1] in globals(), {'self':vpu, 'add':add, 'val':val}
 
 
 class Vpu:
-    def __init__(self, n=8, MpMem={}, Inter=None, RAMSize=1000):
-        """This is where all the pseudo-code is specified. Any new
-        intruction added shoud be added to the constants.py module
-        too, where the lexical information resides.  @arg n: is the
-        number of registers to support."""
-        self.reg = []
+    def __init__(self, n=8, MpMem={}, Inter=None, RAMSize=1000, word=None):
+        """This is where all the instruction handlers are registered.
+        Any new intruction added shoud be added to the constants.py
+        module too, where the lexical information resides.  @arg n: is
+        the number of registers to support.  @arg word: None for
+        unbounded integers kept in lists, or 16 or 32 for two's
+        complement words with wraparound, kept in arrays."""
+        self.word = word
+        self.typecode, self.wrap = words[word]
         self.nreg = n
-        for i in range(n): self.reg.append(0)
-        self.RAM = []
-        self.Prog = []
+        self.reg = self.words(n)
+        self.RAM = self.words(0)
+        self.Prog = Program()
         self.labelp = {}
         self.labelm = {}
         self.labelms = {}
@@ -51,135 +208,152 @@ class Vpu:
         self.StaticMem = 0
         self.lines = []
         self.time0, self.time = 0,0
+        self.steps = 0
+        self.stepTimer = False
+        self.changed = (None,None)
         self.Inter=Inter
         self.RAMSize = RAMSize
-        self.MpMem = copy.deepcopy(MpMem)
-        self.code = {'add':("Reg[A2] = Reg[A2] + Reg[A1]",
-                            "incPC()"),
-                     'and':("Reg[A2] = Reg[A1] & Reg[A2]",
-                            "incPC()"),
-                     'dec':("Reg[A1] = Reg[A1] - 1",
-                            "incPC()"),
-                     'div':("Reg[A2] = Reg[A1] / Reg[A2]",
-                            "incPC()"),
-                     'halt':("raise EndOfProgram"),
-                     'inc':("Reg[A1] = Reg[A1] + 1",
-                            "incPC()"),
-                     'jneg':("if Reg[A1] < 0:",
-                             " if type(A2) == type(''):",
-                             "  add = self.ParseLabelP(A2)",
-                             " else: add = A2",
-                             " self.PC = add",
-                             "else: self.PC = self.PC + 1"),
-                     'jpos':("if Reg[A1] > 0:",
-                             " if type(A2) == type(''):",
-                             "  add = self.ParseLabelP(A2)",
-                             " else: add = A2",
-                             " self.PC = add",
-                             "else: self.PC = self.PC + 1"),
-                     'jsr':("if type(A1) == type(''):",
-                            " add = self.ParseLabelP(A1)",
-                            "else: add = A1",
-                            "self.push(self.PC + 1)",
-                            "self.PC = add"),
-                     'jump':("if type(A1) == type(''):",
-                             " try: add = self.labelp[A1]",
-                             " except KeyError: raise LabelError",
-                             "else: add = A1",
-                             "self.PC = add"),
-                     'jumpi':("self.PC = Reg[A1]"),
-                     'jnzero':("if Reg[A1] != 0:",
-                              " if type(A2) == type(''):",
-                              "  add = self.ParseLabelP(A2)",
-                              " else: add = i[2]",
-                              " self.PC = add",
-                              "else: self.PC = self.PC + 1"),
-                     'jzero':("if Reg[A1] == 0:",
-                              " if type(A2) == type(''):",
-                              "  add = self.ParseLabelP(A2)",
-                              " else: add = i[2]",
-                              " self.PC = add",
-                              "else: self.PC = self.PC + 1"),
-                     'load':("if type(A1) == type(''):",
-                             " try: add = self.labelm[A1]",
-                             " except KeyError: raise LabelError",
-                             "else: add = A1",
-                             "try: foo = self.MLoad(add)",
-                             "except IndexError: raise OutOfMemory(add)",
-                             "Reg[A2] = foo",
-                             "incPC()"),
-                     'loadi':("add = Reg[A1]",
-                              "try: foo = self.MLoad(add)",
-                              "except IndexError: raise OutOfMemory(add)",
-                              "Reg[A2] = foo",
-                              "incPC()"),
-                     'loadn':("if type(A1) == type(''):",
-                              " v = self.ParseLabel(A1)",
-                              "else: v = A1",
-                              "Reg[A2] = v",
-                              "incPC()"),
-                     'loado':("add = Reg[self.FPn]+A1",
-                              "try: foo = self.MLoad(add)",
-                              "except IndexError: raise OutOfMemory(add)",
-                              "Reg[A2] = foo",
-                              "incPC()"),
-                     'mod':("Reg[A2] = Reg[A1] % Reg[A2]",
-                            "incPC()"),
-                     'mul':("Reg[A2] = Reg[A1] * Reg[A2]",
-                            "incPC()"),
-                     'or':("Reg[A2] = Reg[A1] | Reg[A2]",
-                           "incPC)"),
-                     'pop':("Reg[A1] = self.pop()",
-                            "incPC()"),
-                     'push':("self.push(Reg[A1])",
-                             "incPC()"),
-                     'rtn':("self.PC = self.pop()"),
-                     'store':("if type(A2) == type (''):",
-                              " try: add = self.labelm[A2]",
-                              " except KeyError: raise LabelError",
-                              "else: add = A2",
-                              "foo = Reg[A1]",
-                              "try: self.MStore(add,foo)",
-                              "except IndexError: raise OutOfMemory(add)",
-                              "incPC()"),
-                     'storei':("try: self.MStore(Reg[A2],Reg[A1])",
-                               "except IndexError:",
-                               " raise OutOfMemory(Reg[A2])",
-                               "incPC()"),
-                     'storen':("if type(A1) == type(''):",
-                               " r = self.ParseLabel(A1)",
-                               "else: r = A1",
-                               "Reg[A2]=r",
-                               "incPC()"),
-                     'storeo':("add = Reg[self.FPn]+A2",
-                               "try:self.MStore(add,Reg[A1])",
-                               "except IndexError:",
-                               " raise OutOfMemory(add)",
-                               "incPC()"),
-                     'storer':("Reg[A2] = Reg[A1]",
-                               "incPC()"),
-                     'sub':("Reg[A2] = Reg[A1] - Reg[A2]",
-                            "incPC()"),
-                     'xor':("Reg[A2] = Reg[A1] ^ Reg[A2]",
-                            "incPC()"),
-                     'nop':("incPC()"),
-                     'zero':("Reg[A1] = 0",
-                             "incPC()")}
-        for k in self.code.keys():
-            self.code[k] = expandCode(self.code[k])
+        self.code = {'add':self.opAdd,
+                     'and':self.opAnd,
+                     'dec':self.opDec,
+                     'div':self.opDiv,
+                     'halt':self.opHalt,
+                     'inc':self.opInc,
+                     'jneg':self.opJneg,
+                     'jpos':self.opJpos,
+                     'jsr':self.opJsr,
+                     'jump':self.opJump,
+                     'jumpi':self.opJumpi,
+                     'jnzero':self.opJnzero,
+                     'jzero':self.opJzero,
+                     'load':self.opLoad,
+                     'loadi':self.opLoadi,
+                     'loadn':self.opLoadn,
+                     'loado':self.opLoado,
+                     'mod':self.opMod,
+                     'mul':self.opMul,
+                     'or':self.opOr,
+                     'pop':self.opPop,
+                     'push':self.opPush,
+                     'rtn':self.opRtn,
+                     'store':self.opStore,
+                     'storei':self.opStorei,
+                     'storen':self.opLoadn,
+                     'storeo':self.opStoreo,
+                     'storer':self.opStorer,
+                     'sub':self.opSub,
+                     'xor':self.opXor,
+                     'nop':self.opNop,
+                     'zero':self.opZero}
+        if word != None:
+            self.code.update({'add':self.opAddW,
+                              'dec':self.opDecW,
+                              'div':self.opDivW,
+                              'inc':self.opIncW,
+                              'mul':self.opMulW,
+                              'sub':self.opSubW})
+        self.fixups = []
+        self.ops = []
+        self.writes = []
+        self.stores = []
+        self.tier = None
+        self.history = None
+        self.profiler = None
+        self.calls = None
+        self.loops = None
+        self.deviceReads = 0
+        self.dirty = {}
+        self.layout = 0
+        self.base = None
+        self.devices = {}
+        self.ramTop = RAMSize
+        for add in MpMem.keys():
+            if isinstance(MpMem[add], Device):
+                self.mapDevice(MpMem[add], add)
+            else:
+                self.mapDevice(ExecDevice(MpMem[add]), add)
 
     def clean(self):
         """Ensures all the memory areas are clean."""
-        for i in range(self.nreg): self.reg[i]=0
-        self.RAM = []
-        self.Prog = []
+        self.reg[:] = self.words(self.nreg)
+        self.RAM = self.words(0)
+        self.Prog = Program()
         self.labelp = {}
         self.labelm = {}
         self.labelms = {}
         self.PC = 0
         self.BreakP = []
         self.lines = []
+        self.fixups = []
+        self.ops = []
         self.time0, self.time = 0,0
+        self.steps = 0
+        self.dirty = {}
+        self.layout = self.layout + 1
+
+    def words(self, n):
+        """Returns n zeroed words in the storage type of the
+        processor."""
+        if self.typecode == None:
+            return [0] * n
+        return array(self.typecode, [0]) * n
+
+    def dump(self):
+        """Returns copies of the registers and of the RAM."""
+        return (self.reg[:], self.RAM[:])
+
+    def snapshot(self):
+        """Returns a Snapshot of the registers, PC, RAM, program and
+        label tables.  From now on the RAM pages written are
+        remembered, so that restoring it costs about as much as the
+        memory modified since."""
+        self.base = Snapshot(self)
+        self.dirty = {}
+        return self.base
+
+    def restore(self, snap):
+        """Puts the processor back in the state saved by snapshot.
+        Only the dirty pages are copied when snap is the last snapshot
+        taken or restored and no label has been moved since (see
+        reserveMemory); otherwise everything is."""
+        if snap is self.base and self.layout == snap.layout:
+            size = 1 << PAGEBITS
+            for page in self.dirty.keys():
+                add = page << PAGEBITS
+                self.RAM[add:add+size] = snap.RAM[add:add+size]
+        else:
+            self.RAM[:] = snap.RAM
+            self.Prog = snap.Prog.copy()
+            self.fixups = snap.fixups[:]
+            self.lines = snap.lines[:]
+            self.labelp = snap.labelp.copy()
+            self.labelm = snap.labelm.copy()
+            self.labelms = snap.labelms.copy()
+            self.constants = snap.constants.copy()
+            self.StaticMem = snap.StaticMem
+            self.layout = snap.layout
+            self.link()
+        if self.history != None:
+            self.history.clear()
+        if self.calls != None:
+            self.calls.unwind()
+        if self.loops != None:
+            self.loops.clear()
+        self.reg[:] = snap.reg
+        self.PC = snap.PC
+        self.time, self.steps = snap.time, snap.steps
+        self.changed = (None,None)
+        self.base = snap
+        self.dirty = {}
+
+    def write(self, add, values):
+        """Writes values in consecutive RAM addresses starting at add,
+        as when setting the initial data of a program: mapped devices
+        and the RAM size limit are ignored."""
+        for val in values:
+            self.RAM[add] = val
+            self.dirty[add >> PAGEBITS] = 1
+            add = add + 1
 
     def __str__(self):
         """Only used for debugging purposes."""
@@ -191,37 +365,172 @@ class Vpu:
 
     def MStore(self,add,val):
         """Store in memory shell that deals with mapped memory """
-        global Changed
-        if add in self.MpMem.keys():
-            exec self.MpMem[add][1]
+        if 0 <= add < self.ramTop:
+            self.RAM[add] = val
+            self.dirty[add >> PAGEBITS] = 1
+            self.changed = (add,val)
+        elif self.devices.has_key(add):
+            self.devices[add].store(self, add, val)
         elif self.RAMSize <= add or add < 0:
             raise OutOfMemory(add)
         else:
             self.RAM[add] = val
-            Changed = (add,val)
+            self.dirty[add >> PAGEBITS] = 1
+            self.changed = (add,val)
 
-        
     def MLoad(self,add):
         """Load from RAM shell that deals with mapped memory """
-        if add in self.MpMem.keys():
-            val = 0
-            exec self.MpMem[add][0]
-            return val
+        if 0 <= add < self.ramTop:
+            return self.RAM[add]
+        elif self.devices.has_key(add):
+            self.deviceReads = self.deviceReads + 1
+            return self.wrap(self.devices[add].load(self, add))
         elif self.RAMSize <= add or add < 0:
             raise OutOfMemory(add)
         else:
             return self.RAM[add]
+
+    def mapDevice(self, device, start, end=None):
+        """Maps device at the addresses from start to end (inclusive,
+        defaults to start). Accesses to RAM below the lowest mapped
+        address only cost a bounds compare."""
+        if end == None:
+            end = start
+        for add in range(start, end + 1):
+            self.devices[add] = device
+        self.remap()
+
+    def unmapDevice(self, start, end=None):
+        if end == None:
+            end = start
+        for add in range(start, end + 1):
+            if self.devices.has_key(add):
+                del self.devices[add]
+        self.remap()
+
+    def remap(self):
+        self.ramTop = self.RAMSize
+        for add in self.devices.keys():
+            if 0 <= add < self.ramTop:
+                self.ramTop = add
+        if self.tier != None:
+            self.tier.reset()
         
     def run(self, MaxSteps=1000):
         """Starts the execution of the current program.
 
         @arg MaxSteps: the maximum allowed number of steps to execute
         for infinite loop detection."""
-        i = 0
-        while True:
-            self.step()
-            if i > MaxSteps: raise TooManySteps(i)
-            else: i = i + 1
+        n = 0
+        self.TimerOn()
+        try:
+            i = 0
+            if self.tier != None and self.history == None and self.calls == None and not self.BreakP:
+                i = self.tier.run(MaxSteps + 1)
+            ops = self.ops
+            limit = MaxSteps + 1 - i
+            while True:
+                try: op = ops[self.PC]
+                except IndexError: raise OutOfProgram
+                n = n + 1
+                op()
+                if n > limit: raise TooManySteps(i + n - 1)
+        except InfiniteLoop, error:
+            error.num = self.steps + n
+            raise
+        finally:
+            self.steps = self.steps + n
+            self.TimerOff()
+
+    def useBlocks(self, flag=True):
+        """Turns on (or off) the basic-block translation tier used by
+        run and by cont when there are no breakpoints."""
+        if not flag:
+            self.tier = None
+        elif self.tier == None:
+            self.tier = BlockTier(self)
+
+    def record(self, flag=True, capacity=100000, interval=10000):
+        """Turns on (or off) the recording of the execution history
+        used by back and contBack, keeping the last capacity steps
+        with a checkpoint of the RAM every interval steps. While it
+        is on the block tier is not used."""
+        self.history = None
+        self.link()
+        if flag:
+            self.history = History(self, capacity, interval)
+
+    def profile(self, flag=True):
+        """Turns on (or off) the Profiler in self.profiler, which counts
+        the instructions, jumps and memory accesses of every run, cont,
+        advance and step until it is turned off."""
+        if self.profiler != None:
+            self.profiler.detach()
+        self.profiler = None
+        self.link()
+        if flag:
+            self.profiler = Profiler(self)
+
+    def detectLoops(self, flag=True):
+        """Turns on (or off) the LoopDetector in self.loops, which stops
+        the program with InfiniteLoop as soon as it comes back to a
+        state it has already been in."""
+        self.loops = None
+        self.link()
+        if flag:
+            self.loops = LoopDetector(self)
+
+    def trackCalls(self, flag=True):
+        """Turns on (or off) the CallStack in self.calls, a shadow of
+        the subroutine calls made by jsr and rtn. While it is on the
+        block tier is not used."""
+        self.calls = None
+        self.link()
+        if flag:
+            self.calls = CallStack(self)
+
+    def backtrace(self, error=None):
+        """Returns the subroutine calls active when error was raised
+        (or now), outermost first, as (subroutine, line of the call)
+        pairs; empty if the calls are not being tracked."""
+        if self.calls == None:
+            return []
+        try: return self.calls.backtrace(error.frame)
+        except AttributeError: return self.calls.backtrace()
+
+    def back(self, num=1):
+        """Undoes the last num steps (fewer if the history does not go
+        that far) and returns a Journal of what changed."""
+        journal = Journal()
+        journal.stop = 'start'
+        if self.history != None:
+            step = max(self.history.now - num, self.history.start)
+            self.history.seek(step, journal)
+            if journal.steps == num:
+                journal.stop = 'steps'
+        return journal
+
+    def contBack(self):
+        """Goes back to the last time execution was at a breakpoint
+        (or as far as the history goes) and returns a Journal of what
+        changed."""
+        journal = Journal()
+        journal.stop = 'start'
+        if self.history != None:
+            self.history.seek(self.history.lastBreak(), journal)
+            if journal.steps and self.PC in self.BreakP:
+                journal.stop = 'break'
+        return journal
+
+    def timeSteps(self, flag=True):
+        """Turns on (or off) the timing of each single step. run and
+        cont are always timed as a whole."""
+        self.stepTimer = flag
+
+    def timing(self):
+        """Returns (seconds, instructions) executed since the program
+        was loaded."""
+        return (self.time, self.steps)
 
     def setbreak(self,linum):
         """Create a breakpoint"""
@@ -234,55 +543,448 @@ class Vpu:
             del(self.BreakP[self.BreakP.index(linum)])
 
     def cont(self,num):
-        i = 0
-        while True:
-            self.step()
-            if i > num: raise TooManySteps(num)
-            i = i + 1
-            if self.PC in self.BreakP:
-                return 
+        n = 0
+        self.TimerOn()
+        try:
+            i = 0
+            if self.tier != None and self.history == None and self.calls == None and not self.BreakP:
+                i = self.tier.run(num + 1)
+            ops = self.ops
+            BreakP = self.BreakP
+            limit = num + 1 - i
+            while True:
+                try: op = ops[self.PC]
+                except IndexError: raise OutOfProgram
+                n = n + 1
+                op()
+                if n > limit: raise TooManySteps(num)
+                if self.PC in BreakP:
+                    return
+        except InfiniteLoop, error:
+            error.num = self.steps + n
+            raise
+        finally:
+            self.steps = self.steps + n
+            self.TimerOff()
+
+    def advance(self, num=-1, breakpoints=False, MaxSteps=None):
+        """Executes num steps (or until the end of the program if num
+        is -1), stopping earlier at a breakpoint if breakpoints is
+        true, and returns a Journal of what was done. Errors do not
+        propagate, they are reported in the journal.
+
+        @arg MaxSteps: as in run, for infinite loop detection."""
+        journal = Journal()
+        first = self.reg[:]
+        touched = {}
+        mem = journal.mem
+        ops, writes, stores = self.ops, self.writes, self.stores
+        RAM = self.RAM
+        n = 0
+        self.TimerOn()
+        try:
+            try:
+                while n != num:
+                    pc = self.PC
+                    try: op = ops[pc]
+                    except IndexError: raise OutOfProgram
+                    for r in writes[pc]:
+                        touched[r] = 1
+                    add = None
+                    if stores[pc] != None:
+                        add = self.target(pc)
+                        if 0 <= add < len(RAM):
+                            old = RAM[add]
+                    self.changed = (None,None)
+                    n = n + 1
+                    op()
+                    if add != None and self.changed[0] == add and not mem.has_key(add):
+                        mem[add] = old
+                    if MaxSteps != None and n > MaxSteps + 1:
+                        raise TooManySteps(n - 1)
+                    if breakpoints and self.PC in self.BreakP:
+                        journal.stop = 'break'
+                        break
+                else:
+                    journal.stop = 'steps'
+            except Exception, error:
+                if isinstance(error, InfiniteLoop):
+                    error.num = self.steps + n
+                journal.stop = 'error'
+                journal.error = error
+        finally:
+            self.steps = self.steps + n
+            self.TimerOff()
+        journal.steps = n
+        for add in mem.keys():
+            mem[add] = (mem[add], RAM[add])
+        for r in touched.keys():
+            journal.regs[r] = (first[r], self.reg[r])
+        return journal
+
+    def target(self, pc):
+        """Returns the RAM address the instruction at pc is about to
+        write, or None if it does not write memory."""
+        if self.stores[pc] == None:
+            return None
+        mode, arg = self.stores[pc]
+        if mode == 'a':
+            return arg
+        elif mode == 'r':
+            return self.reg[arg]
+        elif mode == 'o':
+            return self.reg[self.FPn] + arg
+        else:
+            return self.reg[self.SPn] + 1
 
     def step(self):
         """basic execution of a step of the program"""
-        global Changed
-        Changed=(None,None)
-        self.TimerOn()
+        self.changed = (None,None)
         try:
-            i = self.Prog[self.PC]
+            op = self.ops[self.PC]
         except IndexError:
-            self.TimerOff()
             raise OutOfProgram
-        if type(i) == type(''): # no args
-            exec self.code[i]
+        self.steps = self.steps + 1
+        if self.stepTimer:
+            self.TimerOn()
+            try: op()
+            finally: self.TimerOff()
         else:
-            exec self.code[i[0]]
-        self.TimerOff()
-        return Changed
+            op()
+        return self.changed
     
     def incPC(self):
         self.PC = self.PC + 1
-        
+
+    def verify(self):
+        """Checks the operands of the whole program and replaces every
+        label by its address, so that the instruction handlers need no
+        further checks. All the bad references are reported at once
+        with an UnresolvedLabels exception. The instructions that
+        refer to memory labels are remembered in self.fixups, as the
+        tutor may relocate those labels."""
+        errors = []
+        self.fixups = []
+        # the instructions as load leaves them, labels and all
+        prog = self.Prog
+        size = len(prog)
+        for pc in range(size):
+            i = prog[pc]
+            try: kinds = operands[i[0]]
+            except KeyError:
+                raise IllInst(self.lines[pc])
+            for k in range(1,len(i)):
+                kind, arg = kinds[k-1], i[k]
+                if kind == 'r':
+                    if arg < 0 or arg >= self.nreg:
+                        raise IllReg(self.lines[pc])
+                    continue
+                if type(arg) == type(''):
+                    if kind == 'p' and self.labelp.has_key(arg):
+                        add = self.labelp[arg]
+                    elif kind == 'm' and self.labelm.has_key(arg):
+                        add = self.labelm[arg]
+                        self.fixups.append((pc,k,arg))
+                    elif self.constants.has_key(arg):
+                        add = self.constants[arg]
+                    else:
+                        errors.append((self.lines[pc],arg))
+                        continue
+                    i = i[:k] + (add,) + i[k+1:]
+                if i[0] == 'loadn':
+                    i = i[:k] + (self.wrap(i[k]),) + i[k+1:]
+                if kind == 'p' and (i[k] < 0 or i[k] >= size):
+                    errors.append((self.lines[pc],str(arg)))
+            prog[pc] = i
+        if errors:
+            raise UnresolvedLabels(errors)
+        self.Prog = Program(prog)
+
+    def relocate(self):
+        """Updates the instructions that refer to memory labels after
+        some of them were moved."""
+        for (pc,k,label) in self.fixups:
+            i = self.Prog[pc]
+            self.Prog[pc] = i[:k] + (self.labelm[label],) + i[k+1:]
+        self.layout = self.layout + 1
+        self.link()
+
+    def link(self):
+        """Binds every instruction of the loaded program to its handler,
+        with the operands already in place, so that executing a step
+        is just a call."""
+        self.ops = ops = []
+        self.writes = writes = []
+        self.stores = targets = []
+        handlers = [self.code.get(name) for name in opnames]
+        prog = self.Prog
+        opcode, operand1, operand2 = prog.opcode, prog.operand1, prog.operand2
+        for pc in range(len(opcode)):
+            c = opcode[pc]
+            handler = handlers[c]
+            if handler == None:
+                raise IllInst(self.lines[pc])
+            i = (c, operand1[pc], operand2[pc])
+            n = arities[c]
+            if n == 0:
+                ops.append(partial(handler))
+            elif n == 1:
+                ops.append(partial(handler, i[1]))
+            else:
+                ops.append(partial(handler, i[1], i[2]))
+            w = ()
+            if resultOperand[c]:
+                w = (i[resultOperand[c]],)
+            if onStack[c]:
+                w = w + (self.SPn,)
+            writes.append(w)
+            if storeOperand[c] == None:
+                targets.append(None)
+            else:
+                mode, k = storeOperand[c]
+                if k: targets.append((mode, i[k]))
+                else: targets.append((mode, None))
+        if self.tier != None:
+            self.tier.reset()
+        if self.profiler != None:
+            self.profiler.reset()
+        if self.calls != None:
+            self.calls.reset()
+        if self.loops != None:
+            self.loops.reset()
+        if self.history != None:
+            self.history.reset()
+
+    # Instruction handlers. A1 and A2 are the operands as stored in
+    # Prog, already verified: registers are indexes in self.reg and
+    # labels have been replaced by their addresses.
+    def opAdd(self, A1, A2):
+        Reg = self.reg
+        Reg[A2] = Reg[A2] + Reg[A1]
+        self.PC = self.PC + 1
+
+    def opAddW(self, A1, A2):
+        Reg = self.reg
+        Reg[A2] = self.wrap(Reg[A2] + Reg[A1])
+        self.PC = self.PC + 1
+
+    def opAnd(self, A1, A2):
+        Reg = self.reg
+        Reg[A2] = Reg[A1] & Reg[A2]
+        self.PC = self.PC + 1
+
+    def opDec(self, A1):
+        self.reg[A1] = self.reg[A1] - 1
+        self.PC = self.PC + 1
+
+    def opDecW(self, A1):
+        self.reg[A1] = self.wrap(self.reg[A1] - 1)
+        self.PC = self.PC + 1
+
+    def opDiv(self, A1, A2):
+        Reg = self.reg
+        Reg[A2] = Reg[A1] / Reg[A2]
+        self.PC = self.PC + 1
+
+    def opDivW(self, A1, A2):
+        Reg = self.reg
+        Reg[A2] = self.wrap(Reg[A1] / Reg[A2])
+        self.PC = self.PC + 1
+
+    def opHalt(self):
+        raise EndOfProgram
+
+    def opInc(self, A1):
+        self.reg[A1] = self.reg[A1] + 1
+        self.PC = self.PC + 1
+
+    def opIncW(self, A1):
+        self.reg[A1] = self.wrap(self.reg[A1] + 1)
+        self.PC = self.PC + 1
+
+    def opJneg(self, A1, A2):
+        if self.reg[A1] < 0: self.PC = A2
+        else: self.PC = self.PC + 1
+
+    def opJpos(self, A1, A2):
+        if self.reg[A1] > 0: self.PC = A2
+        else: self.PC = self.PC + 1
+
+    def opJsr(self, A1):
+        self.push(self.PC + 1)
+        self.PC = A1
+
+    def opJump(self, A1):
+        self.PC = A1
+
+    def opJumpi(self, A1):
+        self.PC = self.reg[A1]
+
+    def opJnzero(self, A1, A2):
+        if self.reg[A1] != 0: self.PC = A2
+        else: self.PC = self.PC + 1
+
+    def opJzero(self, A1, A2):
+        if self.reg[A1] == 0: self.PC = A2
+        else: self.PC = self.PC + 1
+
+    def opLoad(self, A1, A2):
+        try: foo = self.MLoad(A1)
+        except IndexError: raise OutOfMemory(A1)
+        self.reg[A2] = foo
+        self.PC = self.PC + 1
+
+    def opLoadi(self, A1, A2):
+        add = self.reg[A1]
+        try: foo = self.MLoad(add)
+        except IndexError: raise OutOfMemory(add)
+        self.reg[A2] = foo
+        self.PC = self.PC + 1
+
+    def opLoadn(self, A1, A2):
+        self.reg[A2] = A1
+        self.PC = self.PC + 1
+
+    def opLoado(self, A1, A2):
+        add = self.reg[self.FPn] + A1
+        try: foo = self.MLoad(add)
+        except IndexError: raise OutOfMemory(add)
+        self.reg[A2] = foo
+        self.PC = self.PC + 1
+
+    def opMod(self, A1, A2):
+        Reg = self.reg
+        Reg[A2] = Reg[A1] % Reg[A2]
+        self.PC = self.PC + 1
+
+    def opMul(self, A1, A2):
+        Reg = self.reg
+        Reg[A2] = Reg[A1] * Reg[A2]
+        self.PC = self.PC + 1
+
+    def opMulW(self, A1, A2):
+        Reg = self.reg
+        Reg[A2] = self.wrap(Reg[A1] * Reg[A2])
+        self.PC = self.PC + 1
+
+    def opOr(self, A1, A2):
+        Reg = self.reg
+        Reg[A2] = Reg[A1] | Reg[A2]
+        self.PC = self.PC + 1
+
+    def opPop(self, A1):
+        self.reg[A1] = self.pop()
+        self.PC = self.PC + 1
+
+    def opPush(self, A1):
+        self.push(self.reg[A1])
+        self.PC = self.PC + 1
+
+    def opRtn(self):
+        self.PC = self.pop()
+
+    def opStore(self, A1, A2):
+        try: self.MStore(A2, self.reg[A1])
+        except IndexError: raise OutOfMemory(A2)
+        self.PC = self.PC + 1
+
+    def opStorei(self, A1, A2):
+        try: self.MStore(self.reg[A2], self.reg[A1])
+        except IndexError:
+            raise OutOfMemory(self.reg[A2])
+        self.PC = self.PC + 1
+
+    def opStoreo(self, A1, A2):
+        add = self.reg[self.FPn] + A2
+        try: self.MStore(add, self.reg[A1])
+        except IndexError:
+            raise OutOfMemory(add)
+        self.PC = self.PC + 1
+
+    def opStorer(self, A1, A2):
+        self.reg[A2] = self.reg[A1]
+        self.PC = self.PC + 1
+
+    def opSub(self, A1, A2):
+        Reg = self.reg
+        Reg[A2] = Reg[A1] - Reg[A2]
+        self.PC = self.PC + 1
+
+    def opSubW(self, A1, A2):
+        Reg = self.reg
+        Reg[A2] = self.wrap(Reg[A1] - Reg[A2])
+        self.PC = self.PC + 1
+
+    def opXor(self, A1, A2):
+        Reg = self.reg
+        Reg[A2] = Reg[A1] ^ Reg[A2]
+        self.PC = self.PC + 1
+
+    def opNop(self):
+        self.PC = self.PC + 1
+
+    def opZero(self, A1):
+        self.reg[A1] = 0
+        self.PC = self.PC + 1
+
     def load(self,program):
+        """Assembles program, a list or any other iterable (see
+        StreamProgram) of (line number, [label or [], instruction,
+        operands...]), going through it once."""
         self.clean()
+        Prog, nreg = [], self.nreg
+        regs = registers(nreg)
         for (n,i) in program:
             if len(i) < 2:
                 if i[0] == []: raise LabelError(n)
                 else: i.append('nop')
+            shape = opcodes.get(i[1])
+            if shape != None:
+                if i[0] != []:
+                    validateLabelName(i[0],n)
+                    self.labelp[i[0]] = len(Prog)
+                self.lines.append(n)
+                if len(i) != len(shape) + 2: raise BadArgs(n, i[1])
+                # the registers are checked before the other operands,
+                # the usual names by table
+                if shape == '':
+                    Prog.append((i[1],))
+                elif shape == 'n':
+                    Prog.append((i[1],self.ParseNum(i[2])))
+                elif shape == 'r':
+                    r1 = regs.get(i[2])
+                    if r1 == None: r1 = ParseReg(i[2],nreg,n)
+                    Prog.append((i[1],r1))
+                elif shape == 'rr':
+                    r1 = regs.get(i[2])
+                    if r1 == None: r1 = ParseReg(i[2],nreg,n)
+                    r2 = regs.get(i[3])
+                    if r2 == None: r2 = ParseReg(i[3],nreg,n)
+                    Prog.append((i[1],r1,r2))
+                elif shape == 'nr':
+                    r1 = regs.get(i[3])
+                    if r1 == None: r1 = ParseReg(i[3],nreg,n)
+                    Prog.append((i[1],self.ParseNum(i[2]),r1))
+                else:
+                    r1 = regs.get(i[2])
+                    if r1 == None: r1 = ParseReg(i[2],nreg,n)
+                    Prog.append((i[1],r1,self.ParseNum(i[3])))
+                continue
             if i[1] == 'equ':
                 if len(i) != 3:
-                    raise BadArgs(n)
+                    raise BadArgs(n, i[1])
                 if i[0] == []:
-                    raise BadArgs(n)
+                    raise BadArgs(n, i[1])
                 else:
                     validateLabelName(i[0],n)
                     if isNumber(i[2]):
                         self.constants[i[0]]= int(i[2])
                     else:
-                        raise BadArgs(n)
+                        raise BadArgs(n, i[1])
                 continue
             if i[1] == 'const':
                 if len(i) != 3:
-                    raise BadArgs(n)
+                    raise BadArgs(n, i[1])
                 if i[0] != []:
                     validateLabelName(i[0],n)
                     self.labelm[i[0]] = len(self.RAM)
@@ -291,80 +993,65 @@ class Vpu:
                 else:
                     self.labelms[lastLabel] = self.labelms[lastLabel] + 1
                 r = charORint(i[2],n)
-                self.RAM.append(r)
+                self.RAM.append(self.wrap(r))
                 continue
             if i[1] == "string":
                 if len(i) != 3:
-                    raise BadArgs(n)
+                    raise BadArgs(n, i[1])
                 strarg = validateString(i[2],n)
                 if i[0] != []:
                     validateLabelName(i[0],n)
                     self.labelm[i[0]] = len(self.RAM)
                     self.labelms[i[0]] = len(strarg)+1
-                for j in strarg:
-                    self.RAM.append(ord(j))
+                self.RAM.extend(map(ord, strarg))
                 self.RAM.append(0)
                 continue
             if i[1] == 'mem':
                 if len(i) != 3:
-                    raise BadArgs(n)
+                    raise BadArgs(n, i[1])
                 try: r = int(i[2])
                 except ValueError:
-                    raise NotInt(n)
+                    raise NotInt(n, i[2])
                 if i[0] != []:
                     validateLabelName(i[0],n)
                     self.labelm[i[0]] = len(self.RAM)
                     self.labelms[i[0]] = r  # this is only for tutor use 
-                for foo in range(r):
-                    self.RAM.append(0)
+                self.RAM.extend(self.words(r))
                 continue
             if i[0] != []:
                 validateLabelName(i[0],n)
-                self.labelp[i[0]] = len(self.Prog)
-            self.lines.append(n)
-            if i[1] in inst[0]: # no args
-                if len(i) != 2: raise BadArgs(n)
-                else: self.Prog.append((i[1],))
-            elif i[1] in inst[1]: # nonreg
-                if len(i) != 3: raise BadArgs(n)
-                else: self.Prog.append((i[1],self.ParseNum(i[2])))
-            elif i[1] in inst[2]: # reg
-                if len(i) != 3: raise BadArgs(n)
-                r1 = ParseReg(i[2],self.nreg,n)
-                self.Prog.append((i[1],r1))
-            elif i[1] in inst[3]: # reg reg
-                if len(i) != 4: raise BadArgs(n)
-                r1 = ParseReg(i[2],self.nreg,n)
-                r2 = ParseReg(i[3],self.nreg,n)
-                self.Prog.append((i[1],r1,r2))
-            elif i[1] in inst[4]: # nonreg reg
-                if len(i) != 4: raise BadArgs(n)
-                r1 = ParseReg(i[3],self.nreg,n)
-                self.Prog.append((i[1],self.ParseNum(i[2]),r1))
-            elif i[1] in inst[5]: # reg nonreg
-                if len(i) != 4: raise BadArgs(n)
-                r1 = ParseReg(i[2],self.nreg,n)
-                self.Prog.append((i[1],r1,self.ParseNum(i[3])))
-            else:
-                raise IllInst(n)
+            raise IllInst(n, i[1])
         self.StaticMem = len(self.RAM)-1
-        self.RAM += [ 0 for i in xrange(self.RAMSize)]
+        self.RAM.extend(self.words(self.RAMSize))
         self.reg[self.SPn] = self.StaticMem
         self.reg[self.FPn] = self.reg[self.SPn] + 1
+        self.Prog = Prog
+        self.verify()
+        self.link()
         
     def push(self,val):
-        self.reg[self.SPn] += 1
-        self.MStore(self.reg[self.SPn],val)
+        sp = self.reg[self.SPn] + 1
+        self.reg[self.SPn] = sp
+        if 0 <= sp < self.ramTop:
+            self.RAM[sp] = val
+            self.dirty[sp >> PAGEBITS] = 1
+            self.changed = (sp,val)
+        else:
+            self.MStore(sp,val)
         
     def pop(self):
-        if self.reg[self.SPn] <= self.StaticMem:
-            raise MemoryUnderflow(self.reg[self.SPn])
-        foo = self.MLoad(self.reg[self.SPn])
-        self.reg[self.SPn] -= 1
+        sp = self.reg[self.SPn]
+        if sp <= self.StaticMem:
+            raise MemoryUnderflow(sp)
+        if 0 <= sp < self.ramTop:
+            foo = self.RAM[sp]
+        else:
+            foo = self.MLoad(sp)
+        self.reg[self.SPn] = sp - 1
         return foo
         
     def ParseNum(self,st):
-        if st in self.constants.keys():
+        if self.constants.has_key(st):
             return self.constants[st]
         elif st[0] in string.digits or st[0] == '-':
             return int(st)
@@ -392,19 +1079,19 @@ class Vpu:
     def reserveMemory1(self,label,size):
         self.destructLabel(label)
         self.labelm[label] = len(self.RAM)
-        for i in range(size):
-            self.RAM.append(0)
+        self.RAM.extend(self.words(size))
         self.labelms[label] = size
+        self.relocate()
 
     def relocateLabel(self,label,dif):
         for n in self.labelm.keys():
             if self.labelm[n] > self.labelm[label] :
                 self.labelm[n] = self.labelm[n] + dif
         if dif > 0:
-            for i in range(dif):
-                self.RAM.insert(self.labelm[label],0)
+            add = self.labelm[label]
+            self.RAM[add:add] = self.words(dif)
         if dif < 0:
-            self.RAM[(self.labelm[label]+ self.labelms[label] +dif):(self.labelm[label]+ self.labelms[label])]=[]
+            del self.RAM[(self.labelm[label]+ self.labelms[label] +dif):(self.labelm[label]+ self.labelms[label])]
 
     def reserveMemory(self,label,size):
         if label in self.labelm.keys():
@@ -412,50 +1099,101 @@ class Vpu:
                 dif = size - self.labelms[label]
                 self.relocateLabel(label,dif)
             else:
-                for i in range(size):
-                    self.RAM[self.labelm[label]+i] = 0
+                add = self.labelm[label]
+                self.RAM[add:add+size] = self.words(size)
         else:
             self.labelm[label] = len(self.RAM)
-            for i in range(size):
-                self.RAM.append(0)
+            self.RAM.extend(self.words(size))
         self.labelms[label] = size
+        self.relocate()
             
     def TimerInit(self):
         self.time = 0
+        self.steps = 0
 
     def TimerOn(self):
-        self.time0 = time.clock()
+        self.time0 = clock()
 
     def TimerOff(self):
-        self.time = self.time + (time.clock() - self.time0)
+        self.time = self.time + (clock() - self.time0)
 
-def ReadProgram(filename):
+def ReadProgram(filename, stream=False):
+    """Reads the program in filename (see ParseProgram); with stream,
+    returns a StreamProgram reading it as it is loaded instead."""
     try:
         input = open(filename, 'r')
     except IOError:
         CantRead(filename)
-    program = []
+    if stream:
+        return StreamProgram(input)
+    return ParseProgram(input)
+
+# a word of the source is anything between blanks; one that starts
+# with # comments out the rest of the line
+word = re.compile(r"\S+")
+labelName = re.compile(r"[A-Za-z][A-Za-z0-9]*$")
+regName = re.compile(r"[Rr][0-9]*$")
+
+def tokenize(line):
+    """Returns the words of a source line, up to a comment, as
+    (column, word) pairs, columns counting from 0."""
+    tokens = []
+    for m in word.finditer(line):
+        w = m.group()
+        if w[0] == '#': break
+        tokens.append((m.start(), w))
+    return tokens
+
+def wordColumn(line, error):
+    """Returns the column, counting from 1, of the word of the source
+    line the load error was raised for, or 0 if it is not known."""
+    target = getattr(error, 'word', None)
+    if target != None:
+        for column, w in tokenize(line):
+            if w == target or w == target + ':':
+                return column + 1
+    return 0
+
+def ParseProgram(input):
+    """Parses the source lines given by input (a file or any other
+    iterable of lines) into a program Vpu.load understands: a list of
+    (line number, [label or [], instruction, operands...])."""
+    return list(StreamProgram(input))
+
+def StreamProgram(input):
+    """Like ParseProgram, but yields the lines of the program as they
+    are read, so that Vpu.load can assemble a source of any size
+    holding only one line of it at a time."""
     linum = 0
-    while 1:
-        line = input.readline()
-        linep = []
+    for line in input:
         linum = linum + 1
-        if not line: break
-        if len(line) == 1: continue
-        line = string.split(line)
-        if line:
-            if line[0][len(line[0])-1] == ':' and line[0][0] != '#':
-                linep.append(line[0][:len(line[0])-1])
-            elif line[0][0] == '#':
-                continue
-            else:
-                linep.append([])
-                linep.append(line[0])
-            for i in range(1,len(line)):
-                if line[i][0] == '#': continue
-                else: linep.append(line[i])
-            program.append((linum,linep))
-    return program
+        # the words tokenize finds, without their columns
+        words = line.split()
+        if '#' in line:
+            for k in range(len(words)):
+                if words[k][0] == '#':
+                    del words[k:]
+                    break
+        if not words: continue
+        first = words[0]
+        if first[-1] == ':':
+            words[0] = first[:-1]
+        else:
+            words.insert(0, [])
+        yield (linum, words)
+
+# names of the registers of processors with n registers, by n
+registerNames = {}
+
+def registers(n):
+    """Returns a dictionary with the register of every usual register
+    name (R0, r0, ..., RS, RF) of a processor with n registers."""
+    if not registerNames.has_key(n):
+        names = {'RS':n-1, 'rs':n-1, 'RF':n-2, 'rf':n-2}
+        for k in range(n):
+            names['R%d' % k] = names['r%d' % k] = k
+        registerNames[n] = names
+    return registerNames[n]
 
 def CantRead(file):
     sys.stderr.write("Error: Cannot read file %s\n"%file)
@@ -463,57 +1201,32 @@ def CantRead(file):
 
 def ParseReg(st,nreg,line):
     if st[0] != 'r' and st[0] != 'R':
-        raise IllOperand(line)
+        raise IllOperand(line, st)
     elif st == "RS" or st == "rs":
-        st = "R%d"%(nreg-1)
+        return nreg-1
     elif st == "RF" or st == "rf":
-        st = "R%d"%(nreg-2)
-    try: i = int(st[1:len(st)])
+        return nreg-2
+    try: i = int(st[1:])
     except ValueError:
-        raise IllOperand(line)
-    if not i in range(nreg):
-        raise IllReg(line)
+        raise IllOperand(line, st)
+    if i < 0 or i >= nreg:
+        raise IllReg(line, st)
     return i
 
-def expandCode(list):
-    if type(list) == type(''):
-        return expandCode1(list)
-    else:
-        s = expandCode1(list[0])
-        for i in list[1:]:
-            s = s + "\n" + expandCode1(i)
-        return s
-    
-def expandCode1(s):
-    subst = (('A1','i[1]'),('A2','i[2]'),('A3','i[3]'),
-             ('Reg','self.reg'),
-             ('incPC()','self.incPC()'),
-             ('RAM','self.RAM'))
-    for i in subst:
-        s = string.replace(s,i[0],i[1])
-    return s
-
 def isNumber(str):
     """Verifies if a string is a number representation"""
-    for i in str:
-        if i not in string.digits: return 0
-    return 1
+    return str == "" or str.isdigit()
 
 def validateLabelName(str,linenum):
     """Verifies if a candidate label name is not of the form R{num}.
     If the first character is a letter and only contains legal chars."""
-    if str[0] not in string.letters:
-        raise LabelNameError(linenum)
-    if str[0] in ["R","r"] and isNumber(str[1:]):
-        raise LabelNameError(linenum)
-    for i in str[1:]:
-        if i not in string.letters + string.digits:
-            raise LabelNameError(linenum)
+    if not labelName.match(str) or regName.match(str):
+        raise LabelNameError(linenum, str)
 
 def validateString(i,n):
     arg = ""
     if i[0] != '"' or i[-1] != '"':
-        raise WrongArg(n)
+        raise WrongArg(n, i)
     flag = False
     for c in i[1:-1]:
         if not flag:
@@ -537,24 +1250,20 @@ def charORint(i,n):
     if i[0] != "'":
         try: r = int(i)
         except ValueError:
-            raise WrongArg(n)
-    elif i[-1] != "'": raise WrongArg(n)
-    elif i[1] != "\\" and len(i) != 3: raise WrongArg(n)
+            raise WrongArg(n, i)
+    elif i[-1] != "'": raise WrongArg(n, i)
+    elif i[1] != "\\" and len(i) != 3: raise WrongArg(n, i)
     elif i[1] != "\\": r = ord(i[1])
     else:
-        if len(i) != 4: raise WrongArg(n)
+        if len(i) != 4: raise WrongArg(n, i)
         elif i[2] == "n": r = ord("\n")
         elif i[2] == "s": r = ord(" ")
         elif i[2] == "t": r = ord("\t")
         elif i[2] == "\\": r = ord("\\")
-        else: raise WrongArg(n)
+        else: raise WrongArg(n, i)
     return r
 
 def isRegName(str):
     """Verifies if this is a register name."""
-    if str[0] not in ['r','R']:
-        return 0
-    elif not isNumber(str[1:]):
-        return 0
-    return 1
+    return regName.match(str) != None
 
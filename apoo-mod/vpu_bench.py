@@ -0,0 +1,276 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the Apoo Virtual Processor
+
+Copyright (C) 1998-2006 Rogério Reis & Nelma Moreira {rvr,nam}@ncc.up.pt
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+Measures, for the given programs and for some synthetic workloads
+whose size is set with -s, how long it takes to build a Vpu, to read
+and load the program and to run it (steps per second, with and
+without the block tier), repeating every measure and summarizing
+them.  Each benchmark runs in a process of its own, when possible,
+so that its peak memory can be told apart.
+
+The results can be written in JSON (-o) and compared with a previous
+result file (-b): the exit status is 1 if some median got slower by
+more than the threshold (-t, in percent).
+
+Usage: vpu_bench.py [-r repeats] [-s scale] [-o out.json] [-b base.json]
+                    [-t threshold] [program.apoo ...]
+"""
+from vpu import Vpu, ReadProgram, clock
+from constants import vpuError
+import sys, os, glob, getopt, tempfile, math, string
+
+try: import json
+except ImportError: json = None
+try: import resource
+except ImportError: resource = None
+
+MAXSTEPS = 100000000
+CONSTRUCTIONS = 100
+
+# synthetic workloads: (source, RAM size), both depending on the scale
+def recursion(n):
+    return ("""	loadn %d R1
+	jsr sum
+	halt
+sum:	jzero R1 end
+	push R1
+	dec R1
+	jsr sum
+	pop R2
+	add R2 R1
+	rtn
+end:	rtn
+""" % n, 3 * n + 100)
+
+def counting(n):
+    return ("""	loadn %d R1
+loop:	jzero R1 end
+	dec R1
+	jump loop
+end:	halt
+""" % (10 * n), 100)
+
+def sweep(n):
+    return ("""v:	mem %d
+	loadn v R2
+	loadn %d R1
+fill:	storei R1 R2
+	inc R2
+	dec R1
+	jnzero R1 fill
+	loadn v R2
+	loadn %d R1
+	zero R3
+sum:	loadi R2 R4
+	add R4 R3
+	inc R2
+	dec R1
+	jnzero R1 sum
+	halt
+""" % (n, n, n), n + 100)
+
+def stack(n):
+    return ("""	loadn %d R1
+loop:	push R1
+	push R1
+	pop R2
+	pop R3
+	dec R1
+	jnzero R1 loop
+	halt
+""" % (5 * n), 100)
+
+synthetic = [('recursion', recursion), ('counting', counting),
+             ('sweep', sweep), ('stack', stack)]
+
+
+def summary(values):
+    """Returns min, median, mean and standard deviation of values."""
+    values = values[:]
+    values.sort()
+    n = len(values)
+    mean = sum(values) / float(n)
+    if n % 2:
+        median = values[n / 2]
+    else:
+        median = (values[n / 2 - 1] + values[n / 2]) / 2.0
+    if n > 1:
+        dev = math.sqrt(sum([(v - mean) ** 2 for v in values]) / (n - 1))
+    else:
+        dev = 0.0
+    return {'min':values[0], 'median':median, 'mean':mean, 'stdev':dev}
+
+def maxrss():
+    """Peak resident memory of this process, in kilobytes."""
+    if resource == None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def measure(filename, RAMSize, repeats):
+    """Runs the benchmark of one program and returns its results."""
+    result = {'file':filename, 'ram':RAMSize}
+    times = []
+    for i in range(repeats):
+        t = clock()
+        for k in range(CONSTRUCTIONS):
+            Vpu(RAMSize=RAMSize)
+        times.append((clock() - t) / CONSTRUCTIONS)
+    result['construct'] = summary(times)
+    times = []
+    for i in range(repeats):
+        vpu = Vpu(RAMSize=RAMSize)
+        t = clock()
+        try:
+            vpu.load(ReadProgram(filename))
+        except vpuError, error:
+            result['error'] = error.__class__.__name__
+            return result
+        times.append(clock() - t)
+    result['load'] = summary(times)
+    for mode in ['step', 'blocks']:
+        times = []
+        for i in range(repeats):
+            vpu = Vpu(RAMSize=RAMSize)
+            vpu.load(ReadProgram(filename))
+            vpu.useBlocks(mode == 'blocks')
+            t = clock()
+            try:
+                vpu.run(MAXSTEPS)
+            except vpuError, error:
+                result['end'] = error.__class__.__name__
+            times.append(clock() - t)
+        result['steps'] = vpu.steps
+        result[mode] = summary(times)
+        if result[mode]['median'] > 0:
+            result[mode]['steps/s'] = vpu.steps / result[mode]['median']
+    result['maxrss'] = maxrss()
+    return result
+
+def isolated(filename, RAMSize, repeats):
+    """Runs measure in a child process, when there is fork, so that
+    maxrss is the peak of that benchmark alone."""
+    if not hasattr(os, 'fork') or json == None:
+        return measure(filename, RAMSize, repeats)
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        try:
+            output = json.dumps(measure(filename, RAMSize, repeats))
+        except:
+            output = json.dumps({'file':filename, 'error':str(sys.exc_info()[0])})
+        os.write(write, output)
+        os._exit(0)
+    os.close(write)
+    data = []
+    while True:
+        s = os.read(read, 65536)
+        if not s: break
+        data.append(s)
+    os.close(read)
+    os.waitpid(pid, 0)
+    return json.loads(string.join(data, ""))
+
+# metrics compared with a baseline: the lower the better
+compared = [('construct', 'median'), ('load', 'median'),
+            ('step', 'median'), ('blocks', 'median')]
+
+def compare(results, baseline, threshold):
+    """Prints how the medians changed against baseline and returns
+    the number of those that got slower by more than threshold
+    percent."""
+    slower = 0
+    for name in sorted(results.keys()):
+        if not baseline.has_key(name):
+            continue
+        for metric, stat in compared:
+            try:
+                new = results[name][metric][stat]
+                old = baseline[name][metric][stat]
+            except KeyError:
+                continue
+            if old <= 0:
+                continue
+            change = 100.0 * (new - old) / old
+            flag = ""
+            if change > threshold:
+                flag = "  SLOWER"
+                slower = slower + 1
+            elif change < -threshold:
+                flag = "  faster"
+            print "%-20s %-10s %12.6f %12.6f %+7.1f%%%s" % (name, metric, old, new,
+                                                           change, flag)
+    return slower
+
+def main(files, repeats=5, scale=10000, output=None, baseline=None, threshold=10.0):
+    benchmarks = []
+    for name in files:
+        benchmarks.append((os.path.basename(name), name, 1000, None))
+    for name, make in synthetic:
+        source, RAMSize = make(scale)
+        fd, path = tempfile.mkstemp(".apoo")
+        os.write(fd, source)
+        os.close(fd)
+        benchmarks.append((name, path, RAMSize, path))
+    results = {}
+    try:
+        for name, path, RAMSize, temporary in benchmarks:
+            r = results[name] = isolated(path, RAMSize, repeats)
+            if r.has_key('error'):
+                print "%-20s %s" % (name, r['error'])
+                continue
+            print "%-20s %10d steps  load %.6fs  step %10.0f/s  blocks %10.0f/s  %s KB" % (
+                name, r['steps'], r['load']['median'], r['step'].get('steps/s', 0),
+                r['blocks'].get('steps/s', 0), r['maxrss'])
+    finally:
+        for name, path, RAMSize, temporary in benchmarks:
+            if temporary:
+                os.remove(temporary)
+    if output != None:
+        file = open(output, 'w')
+        json.dump({'python':sys.version, 'repeats':repeats, 'scale':scale,
+                   'benchmarks':results}, file, indent=1, sort_keys=True)
+        file.close()
+    if baseline != None:
+        base = json.load(open(baseline))['benchmarks']
+        return compare(results, base, threshold)
+    return 0
+
+if __name__ == '__main__':
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "r:s:o:b:t:")
+    except getopt.GetoptError:
+        sys.stderr.write("Usage: vpu_bench.py [-r repeats] [-s scale] [-o out.json] "
+                         "[-b base.json] [-t threshold] [program.apoo ...]\n")
+        sys.exit(2)
+    options = {}
+    for o, v in opts:
+        if o == '-r': options['repeats'] = int(v)
+        elif o == '-s': options['scale'] = int(v)
+        elif o == '-o': options['output'] = v
+        elif o == '-b': options['baseline'] = v
+        elif o == '-t': options['threshold'] = float(v)
+    if not args:
+        here = os.path.dirname(os.path.abspath(sys.argv[0]))
+        args = glob.glob(os.path.join(here, "examples", "*.apoo"))
+        args.sort()
+    if main(args, **options):
+        sys.exit(1)
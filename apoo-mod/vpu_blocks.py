@@ -0,0 +1,231 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Basic-block translation tier for the Apoo Virtual Processor
+
+Copyright (C) 1998-2006 Rogério Reis & Nelma Moreira {rvr,nam}@ncc.up.pt
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+The loaded program is cut in basic blocks (at labels and after any
+instruction that changes the flow of control) and each block is
+translated into a single Python function that does all its register
+and memory work in a row and returns the address of the next
+instruction to execute.
+"""
+from constants import *
+import string
+
+# straight-line instructions: (source, can raise an exception).  %(1)s
+# and %(2)s are replaced by the operands.
+straight = {'add':("reg[%(2)s] = reg[%(2)s] + reg[%(1)s]", False),
+            'and':("reg[%(2)s] = reg[%(1)s] & reg[%(2)s]", False),
+            'dec':("reg[%(1)s] = reg[%(1)s] - 1", False),
+            'div':("reg[%(2)s] = reg[%(1)s] / reg[%(2)s]", True),
+            'inc':("reg[%(1)s] = reg[%(1)s] + 1", False),
+            'load':("try: reg[%(2)s] = vpu.MLoad(%(1)s)\n"
+                    "except IndexError: raise OutOfMemory(%(1)s)", True),
+            'loadi':("add = reg[%(1)s]\n"
+                     "try: reg[%(2)s] = vpu.MLoad(add)\n"
+                     "except IndexError: raise OutOfMemory(add)", True),
+            'loadn':("reg[%(2)s] = %(1)s", False),
+            'loado':("add = reg[vpu.FPn] + %(1)s\n"
+                     "try: reg[%(2)s] = vpu.MLoad(add)\n"
+                     "except IndexError: raise OutOfMemory(add)", True),
+            'mod':("reg[%(2)s] = reg[%(1)s] %% reg[%(2)s]", True),
+            'mul':("reg[%(2)s] = reg[%(1)s] * reg[%(2)s]", False),
+            'or':("reg[%(2)s] = reg[%(1)s] | reg[%(2)s]", False),
+            'pop':("reg[%(1)s] = vpu.pop()", True),
+            'push':("vpu.push(reg[%(1)s])", True),
+            'store':("try: vpu.MStore(%(2)s, reg[%(1)s])\n"
+                     "except IndexError: raise OutOfMemory(%(2)s)", True),
+            'storei':("try: vpu.MStore(reg[%(2)s], reg[%(1)s])\n"
+                      "except IndexError: raise OutOfMemory(reg[%(2)s])", True),
+            'storen':("reg[%(2)s] = %(1)s", False),
+            'storeo':("add = reg[vpu.FPn] + %(2)s\n"
+                      "try: vpu.MStore(add, reg[%(1)s])\n"
+                      "except IndexError: raise OutOfMemory(add)", True),
+            'storer':("reg[%(2)s] = reg[%(1)s]", False),
+            'sub':("reg[%(2)s] = reg[%(1)s] - reg[%(2)s]", False),
+            'xor':("reg[%(2)s] = reg[%(1)s] ^ reg[%(2)s]", False),
+            'nop':("pass", False),
+            'zero':("reg[%(1)s] = 0", False)}
+
+# results that may not fit in a bounded word: (expression, operand
+# where it is stored)
+wrapped = {'add':("reg[%(2)s] + reg[%(1)s]", 2),
+           'dec':("reg[%(1)s] - 1", 1),
+           'div':("reg[%(1)s] / reg[%(2)s]", 2),
+           'inc':("reg[%(1)s] + 1", 1),
+           'mul':("reg[%(1)s] * reg[%(2)s]", 2),
+           'sub':("reg[%(1)s] - reg[%(2)s]", 2)}
+
+# instructions that end a block, %(pc)s is their own address and
+# %(next)s the one that follows.
+branch = {'halt':"vpu.PC = %(pc)s\nraise EndOfProgram",
+          'jneg':"if reg[%(1)s] < 0: return %(2)s\nreturn %(next)s",
+          'jpos':"if reg[%(1)s] > 0: return %(2)s\nreturn %(next)s",
+          'jnzero':"if reg[%(1)s] != 0: return %(2)s\nreturn %(next)s",
+          'jzero':"if reg[%(1)s] == 0: return %(2)s\nreturn %(next)s",
+          'jsr':"vpu.PC = %(pc)s\nvpu.push(%(next)s)\nreturn %(1)s",
+          'jump':"return %(1)s",
+          'jumpi':"return reg[%(1)s]",
+          'rtn':"vpu.PC = %(pc)s\nreturn vpu.pop()"}
+
+# code objects are shared by all the processors running the same
+# program, so each block is compiled only once per process
+_compiled = {}
+MAXCOMPILED = 4096
+
+class BlockTier:
+    def __init__(self, vpu):
+        """Translation tier for vpu. Blocks are translated the first
+        time execution reaches their first instruction."""
+        self.vpu = vpu
+        self.reset()
+
+    def reset(self):
+        """Forgets all the translated blocks; must be called whenever
+        the program is (re)linked."""
+        self.blocks = {}
+        self.leaders = {}
+        for add in self.vpu.labelp.values():
+            self.leaders[add] = 1
+        for i in self.vpu.Prog:
+            kinds = operands[i[0]]
+            if 'p' in kinds:
+                self.leaders[i[kinds.index('p')+1]] = 1
+
+    def run(self, budget):
+        """Executes whole blocks while they fit in budget steps and
+        returns the number of instructions executed, which are also
+        added to the processor's step counter. It stops before
+        a block that does not fit or when the PC leaves the program,
+        leaving the rest to the single step mode."""
+        vpu = self.vpu
+        if vpu.profiler != None or vpu.loops != None:
+            return self.watched(budget)
+        blocks = self.blocks
+        size = len(vpu.Prog)
+        done = 0
+        try:
+            while True:
+                pc = vpu.PC
+                try: block, n = blocks[pc]
+                except KeyError:
+                    if pc < 0 or pc >= size:
+                        break
+                    block, n = blocks[pc] = self.translate(pc)
+                if done + n > budget:
+                    break
+                vpu.PC = block(vpu)
+                done = done + n
+        except:
+            # the block has set the PC to the instruction that failed
+            vpu.steps = vpu.steps + done + vpu.PC - pc + 1
+            raise
+        vpu.steps = vpu.steps + done
+        return done
+
+    def watched(self, budget):
+        """As run, counting every block executed in the processor's
+        profiler and telling its loop detector about the jumps
+        backwards."""
+        vpu = self.vpu
+        blocks = self.blocks
+        # flags, as comparing instances with None is slow
+        counting = vpu.profiler != None
+        watching = vpu.loops != None
+        if counting:
+            spans = vpu.profiler.spans
+        if watching:
+            loops = vpu.loops
+            jumps = loops.jumps
+        size = len(vpu.Prog)
+        done = 0
+        try:
+            while True:
+                pc = vpu.PC
+                try: block, n = blocks[pc]
+                except KeyError:
+                    if pc < 0 or pc >= size:
+                        break
+                    block, n = blocks[pc] = self.translate(pc)
+                if done + n > budget:
+                    break
+                vpu.PC = block(vpu)
+                done = done + n
+                if counting:
+                    key = (pc, n, vpu.PC)
+                    spans[key] = spans.get(key, 0) + 1
+                if watching and vpu.PC < pc + n and jumps.has_key(pc + n - 1):
+                    loops.edge(pc + n - 1)
+        except InfiniteLoop:
+            # raised after the whole block
+            vpu.steps = vpu.steps + done
+            raise
+        except:
+            if counting:
+                vpu.profiler.count(pc, vpu.PC)
+            vpu.steps = vpu.steps + done + vpu.PC - pc + 1
+            raise
+        vpu.steps = vpu.steps + done
+        return done
+
+    def translate(self, start):
+        """Returns (function, number of instructions) for the block
+        that begins at address start."""
+        prog = self.vpu.Prog
+        body = []
+        pc = start
+        while pc < len(prog):
+            if pc != start and self.leaders.has_key(pc):
+                body.append("return %d" % pc)
+                break
+            i = prog[pc]
+            args = {'pc':pc, 'next':pc+1}
+            for k in range(1,len(i)):
+                args[str(k)] = repr(i[k])
+            if i[0] in branch:
+                body.append(branch[i[0]] % args)
+                pc = pc + 1
+                break
+            source, canRaise = straight[i[0]]
+            if self.vpu.word != None and wrapped.has_key(i[0]):
+                half = 1L << (self.vpu.word - 1)
+                expr, k = wrapped[i[0]]
+                source = "reg[%%(%d)s] = ((%s + %d) & %d) - %d" % (k, expr, half,
+                                                                  2*half - 1, half)
+            if canRaise:
+                body.append("vpu.PC = %d\n%s" % (pc,source % args))
+            else:
+                body.append(source % args)
+            pc = pc + 1
+        else:
+            body.append("return %d" % pc)
+        source = "def block(vpu):\n reg = vpu.reg\n"
+        for s in body:
+            source = source + " " + string.replace(s,"\n","\n ") + "\n"
+        return (compileBlock(source), pc - start)
+
+def compileBlock(source):
+    try: code = _compiled[source]
+    except KeyError:
+        if len(_compiled) >= MAXCOMPILED:
+            _compiled.clear()
+        code = _compiled[source] = compile(source, "<apoo block>", "exec")
+    namespace = {'OutOfMemory':OutOfMemory, 'EndOfProgram':EndOfProgram}
+    exec code in namespace
+    return namespace['block']
@@ -0,0 +1,143 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Cache of assembled programs for the Apoo Virtual Processor
+
+Copyright (C) 1998-2006 Rogério Reis & Nelma Moreira {rvr,nam}@ncc.up.pt
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+What Vpu.load makes of a source text depends only on the text and on
+the processor configuration (registers, RAM size, word size and mapped
+addresses), so the Snapshot taken just after loading can be given to
+any processor configured alike instead of parsing and checking the
+text again.  A program that does not load is kept too, with the error
+it raised, but only in memory: exceptions do not reliably survive
+pickling.
+
+The images are kept in memory, the least recently used being dropped
+when there are more than size, and, if a directory is given, pickled
+on disk as well, one file per image.  A cache can be shared by
+threads: its images are only touched holding its lock, which is not
+held while a program is parsed or an image read or written.
+"""
+from constants import vpuError
+from vpu import Snapshot
+from collections import OrderedDict
+import os, hashlib, tempfile, cPickle, threading
+
+VERSION = 2
+
+
+class ImageCache:
+    def __init__(self, size=64, directory=None):
+        self.size = size
+        self.directory = directory
+        self.images = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, vpu, text):
+        """The hash of text and of the configuration of vpu"""
+        config = "%d %d %s %s %s\n" % (VERSION, vpu.nreg, vpu.RAMSize, vpu.word,
+                                       sorted(vpu.devices.keys()))
+        return hashlib.sha1(config + text).hexdigest()
+
+    def load(self, vpu, text, parse):
+        """Loads in vpu the program whose source is text; parse, called
+        only when the program is not in the cache, must return it as
+        Vpu.load wants it. Raises the error loading it raises."""
+        key = self.key(vpu, text)
+        image = self.get(key)
+        if image == None:
+            try:
+                vpu.load(parse())
+                image = Snapshot(vpu)
+            except vpuError, error:
+                image = error
+            self.put(key, image)
+        else:
+            vpu.clean()
+            if isinstance(image, Snapshot):
+                vpu.restore(image)
+        if not isinstance(image, Snapshot):
+            raise image
+
+    def get(self, key):
+        self.lock.acquire()
+        try:
+            image = self.images.pop(key, None)
+            if image != None:
+                self.images[key] = image
+                self.hits = self.hits + 1
+                return image
+        finally:
+            self.lock.release()
+        if self.directory != None:
+            try:
+                file = open(os.path.join(self.directory, key + ".image"), 'rb')
+                try:
+                    image = cPickle.load(file)
+                finally:
+                    file.close()
+                if not isinstance(image, Snapshot):
+                    image = None
+            except Exception:
+                # missing, or left by another version
+                image = None
+        self.lock.acquire()
+        try:
+            if image != None:
+                self.keep(key, image)
+                self.hits = self.hits + 1
+            else:
+                self.misses = self.misses + 1
+        finally:
+            self.lock.release()
+        return image
+
+    def put(self, key, image):
+        self.lock.acquire()
+        try:
+            self.keep(key, image)
+        finally:
+            self.lock.release()
+        if self.directory != None and isinstance(image, Snapshot):
+            # written aside and renamed, for processes sharing the cache
+            fd, temporary = tempfile.mkstemp(".image", "", self.directory)
+            file = os.fdopen(fd, 'wb')
+            try:
+                try:
+                    cPickle.dump(image, file, cPickle.HIGHEST_PROTOCOL)
+                finally:
+                    file.close()
+                os.rename(temporary, os.path.join(self.directory, key + ".image"))
+            except (cPickle.PicklingError, TypeError):
+                os.remove(temporary)
+
+    def keep(self, key, image):
+        """Keeps image in memory, dropping the least recently used
+        images over size; the lock must be held"""
+        self.images[key] = image
+        while len(self.images) > self.size:
+            self.images.popitem(False)
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            self.images.clear()
+        finally:
+            self.lock.release()
@@ -0,0 +1,142 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Console devices for the Apoo Virtual Processor
+
+Copyright (C) 1998-2006 Rogério Reis & Nelma Moreira {rvr,nam}@ncc.up.pt
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+The console is what a program reads and writes through three memory
+mapped devices: integers are read and written at INPUT_OUTPUT,
+characters written at OUTPUT_ASCII and new lines at OUTPUT_CR (the
+addresses the interface uses by default).  The interface, the command
+line runner and the tutor all use it.
+
+The input is given up front, as a file or any iterable of lines or of
+integers, the words of a line being separated by blanks.  When it runs
+out, ask is called for the next value, if it was given (the interface
+asks in a dialog); otherwise InputError is raised.
+
+The output is kept in memory until it is taken, or, when there is an
+output stream, written to it in chunks and whenever input is read.
+Writing more than limit characters in all raises TooMuchOutput.
+"""
+from constants import InputError, TooMuchOutput
+from vpu import Device
+
+OUTPUT_ASCII = 50000
+INPUT_OUTPUT = 50001
+OUTPUT_CR = 50010
+# output limit of the interface and of the tutor
+LIMIT = 1 << 20
+# output kept before it is written to the output stream
+CHUNK = 1 << 16
+
+
+class Console:
+    def __init__(self, input=(), output=None, limit=None, ask=None):
+        self.output = output
+        self.limit = limit
+        self.ask = ask
+        self.reset(input)
+
+    def reset(self, input=()):
+        """Starts again with input, dropping the output not taken"""
+        self.feed(input)
+        self.pending = []
+        self.size = 0
+        self.written = 0
+
+    def feed(self, input):
+        """Replaces what is left of the input"""
+        self.input = iter(input)
+        self.words = []
+
+    def read(self):
+        while not self.words:
+            # what was asked for must be seen before waiting for the answer
+            self.flush()
+            try:
+                item = self.input.next()
+            except StopIteration:
+                if self.ask != None:
+                    return self.ask()
+                raise InputError("end of input")
+            if isinstance(item, (int, long)):
+                return item
+            self.words = item.split()
+            self.words.reverse()
+        word = self.words.pop()
+        try:
+            return int(word)
+        except ValueError:
+            raise InputError("%s is not an integer" % word)
+
+    def write(self, text):
+        self.written = self.written + len(text)
+        if self.limit != None and self.written > self.limit:
+            raise TooMuchOutput(self.limit)
+        self.pending.append(text)
+        self.size = self.size + len(text)
+        if self.output != None and self.size >= CHUNK:
+            self.output.write(self.take())
+
+    def take(self):
+        """Returns the output not yet taken or written"""
+        text = "".join(self.pending)
+        self.pending = []
+        self.size = 0
+        return text
+
+    def flush(self):
+        if self.output != None:
+            if self.pending:
+                self.output.write(self.take())
+            self.output.flush()
+
+    def map(self, vpu, ascii=OUTPUT_ASCII, integer=INPUT_OUTPUT, newline=OUTPUT_CR):
+        """Maps the console devices in vpu"""
+        vpu.mapDevice(AsciiOutput(self), ascii)
+        vpu.mapDevice(IntegerIO(self), integer)
+        vpu.mapDevice(NewLine(self), newline)
+
+class AsciiOutput(Device):
+    """Writes the character, reads 0; values out of 0..255 raise
+    OverflowError, as they always did"""
+    def __init__(self, console):
+        self.console = console
+
+    def store(self, vpu, add, val):
+        self.console.write("%c" % val)
+
+class IntegerIO(Device):
+    """Reads and writes integers"""
+    def __init__(self, console):
+        self.console = console
+
+    def load(self, vpu, add):
+        return self.console.read()
+
+    def store(self, vpu, add, val):
+        self.console.write("%d" % val)
+
+class NewLine(Device):
+    """Writes a new line, reads 0"""
+    def __init__(self, console):
+        self.console = console
+
+    def store(self, vpu, add, val):
+        self.console.write("\n")
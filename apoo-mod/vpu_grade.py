@@ -0,0 +1,177 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Batch grader for the Apoo Virtual Processor
+
+Copyright (C) 1998-2006 Rogério Reis & Nelma Moreira {rvr,nam}@ncc.up.pt
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+Grades many programs with the same tutor file, spreading them over a
+pool of processes (one per core by default).  The programs are the
+*.apoo files of a directory or those listed, one per line, in a
+manifest file.  Every job is bounded in wall clock time (-t seconds),
+in steps per exec block (-s, 1000000 by default where apoo-tutor uses
+1000) and in process memory (-m megabytes).
+
+A JSON object per program is written (to stdout or to -o) as soon as
+it is graded, so the order is not that of the programs: file, status
+(graded, timeout, memory or crash), grade, passed, output, errors,
+code, blocks, messages, steps and seconds.
+
+The tutor file is checked and compiled once, and not used at all if
+it has errors.  The programs assembled are kept by the hash of their
+text, so that identical submissions are parsed once per process; with
+-c the compiled tutor and the programs are also kept in a cache
+directory, shared by the processes and by later runs.
+
+Usage: vpu_grade.py [-j jobs] [-t timeout] [-s steps] [-m megabytes]
+                    [-c cache] [-o out.jsonl] tutor-file
+                    (directory | manifest)
+"""
+from vpu import clock
+from vpu_tutor import grade, lines, compileTutor, images
+import sys, os, glob, getopt, signal, json, multiprocessing, itertools
+
+try: import resource
+except ImportError: resource = None
+
+TIMEOUT = 10.0
+MAXSTEPS = 1000000
+
+
+class Timeout(BaseException):
+    """Not an Exception, so that the tutor does not catch it as a
+    failed exec block"""
+
+def expire(signum, frame):
+    global expired
+    expired = True
+    raise Timeout()
+
+def setup(megabytes, cache):
+    """Caps the memory of the calling process and sets where the
+    programs it assembles are kept"""
+    images.directory = cache
+    if megabytes and resource != None:
+        size = megabytes * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (size, size))
+
+def job(args):
+    """Grades one program and returns its result as a dictionary"""
+    global expired
+    tutor, program, timeout, MaxSteps = args
+    record = {'file':program, 'status':'graded'}
+    expired = False
+    timer = timeout and hasattr(signal, 'setitimer')
+    t = clock()
+    try:
+        if timer:
+            signal.signal(signal.SIGALRM, expire)
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            result = grade(tutor, program, MaxSteps)
+        finally:
+            if timer:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        for name in ['grade', 'passed', 'output', 'errors', 'code',
+                     'blocks', 'messages', 'steps']:
+            record[name] = getattr(result, name)
+        record['passed'] = bool(result.passed)
+        # the tutor catches whatever happens inside an exec block
+        if expired:
+            record['status'] = 'timeout'
+    except Timeout:
+        record['status'] = 'timeout'
+    except MemoryError:
+        record['status'] = 'memory'
+    except Exception, error:
+        record['status'] = 'crash'
+        record['errors'] = "%s: %s" % (error.__class__.__name__, error)
+    record['seconds'] = clock() - t
+    return record
+
+def programs(source):
+    """The programs of a directory or of a manifest file, whose
+    relative names are relative to the manifest"""
+    if os.path.isdir(source):
+        files = glob.glob(os.path.join(source, "*.apoo"))
+        files.sort()
+        return files
+    here = os.path.dirname(source)
+    files = []
+    for line in open(source):
+        name = line.strip()
+        if name and name[0] != '#':
+            files.append(os.path.join(here, name))
+    return files
+
+def main(tutorFile, source, jobs=None, timeout=TIMEOUT, MaxSteps=MAXSTEPS,
+         megabytes=None, output=sys.stdout, cache=None):
+    """Grades the programs of source, writing the results to output.
+    Returns the number of jobs that did not end graded."""
+    tutor = lines(tutorFile)
+    if tutor == None:
+        sys.stderr.write("Error: Cannot read file %s\n" % tutorFile)
+        return 1
+    tutor = compileTutor(tutor, cache)
+    if tutor.errors:
+        for error in tutor.errors:
+            sys.stderr.write("%s: %s\n" % (tutorFile, error))
+        return 1
+    work = [(tutor, program, timeout, MaxSteps) for program in programs(source)]
+    if jobs == 1:
+        setup(megabytes, cache)
+        results = itertools.imap(job, work)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(jobs, setup, (megabytes, cache))
+        results = pool.imap_unordered(job, work)
+    count = {}
+    try:
+        for record in results:
+            output.write(json.dumps(record, sort_keys=True) + "\n")
+            output.flush()
+            count[record['status']] = count.get(record['status'], 0) + 1
+    finally:
+        if pool != None:
+            pool.terminate()
+            pool.join()
+    sys.stderr.write("%d programs: %s\n" % (len(work), ", ".join(
+        ["%d %s" % (count[s], s) for s in sorted(count.keys())])))
+    return len(work) - count.get('graded', 0)
+
+if __name__ == '__main__':
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "j:t:s:m:c:o:")
+    except getopt.GetoptError:
+        args = []
+    if len(args) != 2:
+        sys.stderr.write("Usage: vpu_grade.py [-j jobs] [-t timeout] [-s steps] "
+                         "[-m megabytes] [-c cache] [-o out.jsonl] tutor-file "
+                         "(directory | manifest)\n"
+                         "  -s steps defaults to %d per exec block "
+                         "(apoo-tutor uses 1000)\n" % MAXSTEPS)
+        sys.exit(2)
+    options = {}
+    for o, v in opts:
+        if o == '-j': options['jobs'] = int(v)
+        elif o == '-t': options['timeout'] = float(v)
+        elif o == '-s': options['MaxSteps'] = int(v)
+        elif o == '-m': options['megabytes'] = int(v)
+        elif o == '-c': options['cache'] = v
+        elif o == '-o': options['output'] = open(v, 'w')
+    if main(args[0], args[1], **options):
+        sys.exit(1)
@@ -0,0 +1,150 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Execution history for the Apoo Virtual Processor
+
+Copyright (C) 1998-2006 Rogério Reis & Nelma Moreira {rvr,nam}@ncc.up.pt
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+While it is on, every instruction executed leaves in a ring buffer
+what is needed to undo it: the PC it was at, the old values of the
+registers it writes and the address and old value of the RAM word it
+writes.  Every interval steps a checkpoint of the registers and RAM is
+also kept, so that going back a long way only has to undo the steps
+between the target and the checkpoint that follows it.
+
+Mapped devices are not undone: what was output stays output and what
+was read stays read.
+"""
+from functools import partial
+from constants import PAGEBITS
+
+
+class History:
+    def __init__(self, vpu, capacity=100000, interval=10000):
+        """Keeps the last capacity steps executed by vpu, with a
+        checkpoint every interval steps."""
+        self.vpu = vpu
+        self.capacity = capacity
+        self.interval = interval
+        self.reset()
+
+    def reset(self):
+        """Forgets the whole history and wraps the linked program; must
+        be called whenever the program is (re)linked."""
+        self.clear()
+        vpu = self.vpu
+        self.ops = vpu.ops
+        vpu.ops = [partial(self.record, pc) for pc in range(len(vpu.ops))]
+
+    def clear(self):
+        """Forgets the whole history."""
+        self.deltas = [None] * self.capacity
+        self.checkpoints = {}
+        self.start = 0
+        self.now = 0
+
+    def record(self, pc):
+        """Executes the instruction at pc remembering how to undo it."""
+        vpu = self.vpu
+        reg, RAM = vpu.reg, vpu.RAM
+        regs = tuple([(r, reg[r]) for r in vpu.writes[pc]])
+        add = vpu.target(pc)
+        if add != None and 0 <= add < len(RAM) and not vpu.devices.has_key(add):
+            old = RAM[add]
+        else:
+            add = old = None
+        try:
+            self.ops[pc]()
+        finally:
+            # an instruction that fails can be undone too
+            now = self.now
+            self.deltas[now % self.capacity] = (pc, regs, add, old)
+            now = self.now = now + 1
+            if now - self.start > self.capacity:
+                self.start = now - self.capacity
+            if now % self.interval == 0:
+                self.checkpoints[now] = (reg[:], RAM[:], vpu.PC)
+                for step in self.checkpoints.keys():
+                    if step < self.start:
+                        del self.checkpoints[step]
+
+    def available(self):
+        """Returns the number of steps that can be undone."""
+        return self.now - self.start
+
+    def seek(self, step, journal):
+        """Goes back to the state before the given step, noting in
+        journal the registers and memory changed."""
+        vpu = self.vpu
+        reg, RAM = vpu.reg, vpu.RAM
+        first = reg[:]
+        mem = journal.mem
+        later = [s for s in self.checkpoints.keys() if step <= s < self.now]
+        if later and self.now - step > self.interval:
+            s = min(later)
+            before = RAM[:]
+            creg, cRAM, vpu.PC = self.checkpoints[s]
+            reg[:] = creg
+            RAM[:] = cRAM
+            journal.steps = self.now - s
+            self.now = s
+        else:
+            before = None
+        deltas, capacity = self.deltas, self.capacity
+        while self.now > step:
+            self.now = self.now - 1
+            pc, regs, add, old = deltas[self.now % capacity]
+            vpu.PC = pc
+            for r, val in regs:
+                reg[r] = val
+            if add != None:
+                if before == None and not mem.has_key(add):
+                    mem[add] = RAM[add]
+                RAM[add] = old
+            journal.steps = journal.steps + 1
+        for s in self.checkpoints.keys():
+            if s > step:
+                del self.checkpoints[s]
+        vpu.steps = vpu.steps - journal.steps
+        vpu.changed = (None,None)
+        if before != None:
+            for add in range(len(RAM)):
+                if RAM[add] != before[add]:
+                    mem[add] = before[add]
+        # the pages changed must be copied back by the next restore
+        dirty = vpu.dirty
+        for add in mem.keys():
+            dirty[add >> PAGEBITS] = 1
+            if mem[add] == RAM[add]:
+                del mem[add]
+            else:
+                mem[add] = (mem[add], RAM[add])
+        for r in range(len(reg)):
+            if reg[r] != first[r]:
+                journal.regs[r] = (first[r], reg[r])
+
+    def lastBreak(self):
+        """Returns the last step before now that started at a
+        breakpoint, or the first step kept if there is none."""
+        BreakP = self.vpu.BreakP
+        deltas, capacity = self.deltas, self.capacity
+        step = self.now - 1
+        while step > self.start:
+            if deltas[step % capacity][0] in BreakP:
+                return step
+            step = step - 1
+        return self.start
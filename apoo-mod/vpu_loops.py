@@ -0,0 +1,93 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Infinite loop detection for the Apoo Virtual Processor
+
+Copyright (C) 1998-2006 Rogério Reis & Nelma Moreira {rvr,nam}@ncc.up.pt
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+The processor is deterministic, so if it ever comes back to a state
+(PC, registers and RAM) it has been in, it will loop forever.  States
+are compared every time a jump goes backwards, following Brent's cycle
+detection: one state is kept and replaced when the number of jumps
+since it was taken reaches the next power of two, so a loop is found
+within twice its length (plus the steps before it) with a RAM copy
+only once in a while.  Reading a mapped device makes the state kept
+before it not comparable with the ones after.
+"""
+from functools import partial
+from constants import InfiniteLoop
+
+# the instructions that can jump backwards in a loop
+jumps = ['jneg', 'jpos', 'jnzero', 'jzero', 'jump', 'jumpi']
+
+
+class LoopDetector:
+    def __init__(self, vpu):
+        """Watches vpu from now on; see Vpu.detectLoops."""
+        self.vpu = vpu
+        self.reset()
+
+    def clear(self):
+        """Forgets the state kept, as when the program starts again."""
+        self.PC = None
+        self.power = 1
+        self.count = 0
+        self.first, self.last = len(self.vpu.Prog), -1
+
+    def reset(self):
+        """Wraps the linked program; must be called whenever the
+        program is (re)linked."""
+        self.clear()
+        vpu = self.vpu
+        self.jumps = {}
+        self.ops = vpu.ops
+        ops = []
+        for pc in range(len(vpu.ops)):
+            if vpu.Prog.name(pc) in jumps:
+                self.jumps[pc] = 1
+                ops.append(partial(self.jump, pc))
+            else:
+                ops.append(self.ops[pc])
+        vpu.ops = ops
+
+    def jump(self, pc):
+        self.ops[pc]()
+        if self.vpu.PC <= pc:
+            self.edge(pc)
+
+    def edge(self, pc):
+        """The jump at pc has just gone backwards."""
+        vpu = self.vpu
+        if (vpu.PC == self.PC and vpu.deviceReads == self.reads
+            and vpu.reg == self.reg and vpu.RAM == self.RAM):
+            raise InfiniteLoop(vpu.steps, self.first, self.last,
+                               (self.line(self.first), self.line(self.last)))
+        if vpu.PC < self.first: self.first = vpu.PC
+        if pc > self.last: self.last = pc
+        self.count = self.count + 1
+        if self.count >= self.power:
+            self.PC = vpu.PC
+            self.reads = vpu.deviceReads
+            self.reg = vpu.reg[:]
+            self.RAM = vpu.RAM[:]
+            self.first, self.last = vpu.PC, pc
+            self.power = 2 * self.power
+            self.count = 0
+
+    def line(self, pc):
+        try: return self.vpu.lines[pc]
+        except IndexError: return 0
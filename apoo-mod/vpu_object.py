@@ -0,0 +1,249 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Object files for the Apoo Virtual Processor
+
+Copyright (C) 1998-2006 Rogério Reis & Nelma Moreira {rvr,nam}@ncc.up.pt
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+An object file keeps what Vpu.load makes of a program, so that it can
+be loaded again without assembling it: the instructions, already
+checked and with their labels resolved, the static RAM image, the
+label and constant tables, the source line of every instruction and
+the operands the tutor relocates.
+
+It starts with a header: the magic string APOB, the format version,
+the number of registers and word size it was assembled for (0 for
+unbounded integers), the SHA-1 of the source (zeros if unknown), and
+the size and CRC-32 of the rest.  The rest are sections of 64 bit
+little endian numbers and of NUL separated names, each preceded by
+its length; the instructions are a stream of opcode indexes, in the
+table of opcode names used, each followed by its operands.
+
+Objects are read through mmap.  Loading one that is damaged, of
+another version, made for another processor or, when the source text
+is given, for another source, raises BadObject.
+
+Usage: vpu_object.py [-n registers] [-w word] [-o object] program.apoo
+"""
+from constants import *
+from vpu import Vpu, ReadProgram, Program
+import sys, os, struct, zlib, mmap, hashlib, tempfile, getopt
+
+MAGIC = "APOB"
+VERSION = 1
+# magic, version, registers, word size, source digest, size and CRC-32
+header = struct.Struct("<4sHHH20sII")
+count = struct.Struct("<I")
+NODIGEST = "\0" * 20
+
+
+LOW, HIGH = -2**63, 2**63 - 1
+
+def numbers(values):
+    for v in values:
+        if not LOW <= v <= HIGH:
+            # only processors with unbounded words get such numbers
+            raise BadObject("%d does not fit in 64 bits" % v)
+    return count.pack(len(values)) + struct.pack("<%dq" % len(values), *values)
+
+def names(values):
+    text = "\0".join(values)
+    return count.pack(len(text)) + text
+
+def table(values):
+    keys = values.keys()
+    keys.sort()
+    return names(keys) + numbers([values[k] for k in keys])
+
+def digest(text):
+    if text == None:
+        return NODIGEST
+    return hashlib.sha1(text).digest()
+
+def dump(vpu, filename, text=None):
+    """Writes the program vpu has just loaded to the object file
+    filename; text is its source, if the object is to be checked
+    against it when loaded.  Raises BadObject, writing nothing, if a
+    number of the program does not fit in 64 bits."""
+    used = {}
+    for i in vpu.Prog:
+        used[i[0]] = 1
+    ops = used.keys()
+    ops.sort()
+    index = dict([(ops[k], k) for k in range(len(ops))])
+    stream = []
+    for i in vpu.Prog:
+        stream.append(index[i[0]])
+        stream.extend(i[1:])
+    fixups = vpu.fixups
+    payload = "".join([names(ops), numbers(stream), numbers(vpu.lines),
+                       numbers([vpu.StaticMem]),
+                       numbers(list(vpu.RAM[:vpu.StaticMem+1])),
+                       table(vpu.labelp), table(vpu.labelm),
+                       table(vpu.labelms), table(vpu.constants),
+                       names([label for (pc,k,label) in fixups]),
+                       numbers([pc for (pc,k,label) in fixups]),
+                       numbers([k for (pc,k,label) in fixups])])
+    data = header.pack(MAGIC, VERSION, vpu.nreg, vpu.word or 0, digest(text),
+                       len(payload), zlib.crc32(payload) & 0xffffffff)
+    # written aside and renamed, so that no one reads half an object
+    fd, temporary = tempfile.mkstemp(".apob", "",
+                                     os.path.dirname(os.path.abspath(filename)))
+    mask = os.umask(0)
+    os.umask(mask)
+    os.chmod(temporary, 0666 & ~mask)
+    file = os.fdopen(fd, 'wb')
+    try:
+        file.write(data)
+        file.write(payload)
+    finally:
+        file.close()
+    os.rename(temporary, filename)
+
+
+class Reader:
+    """Reads the sections of an object in turn"""
+    def __init__(self, data, offset):
+        self.data = data
+        self.offset = offset
+
+    def count(self):
+        n, = count.unpack_from(self.data, self.offset)
+        self.offset = self.offset + count.size
+        return n
+
+    def numbers(self):
+        n = self.count()
+        values = struct.unpack_from("<%dq" % n, self.data, self.offset)
+        self.offset = self.offset + 8 * n
+        return values
+
+    def names(self):
+        n = self.count()
+        text = self.data[self.offset:self.offset+n]
+        self.offset = self.offset + n
+        if not text:
+            return []
+        return text.split("\0")
+
+    def table(self):
+        return dict(zip(self.names(), self.numbers()))
+
+def isObject(filename):
+    """Tells if filename is an object file (not if it is a good one)"""
+    try:
+        file = open(filename, 'rb')
+    except IOError:
+        return False
+    try:
+        return file.read(len(MAGIC)) == MAGIC
+    finally:
+        file.close()
+
+def load(vpu, filename, text=None):
+    """Loads in vpu the program in the object file filename, which
+    must have been made from the source text, if it is given."""
+    try:
+        file = open(filename, 'rb')
+    except IOError:
+        raise BadObject("cannot read %s" % filename)
+    try:
+        try:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, EnvironmentError):
+            # empty files and systems without mmap
+            data = file.read()
+        try:
+            if len(data) < header.size:
+                raise BadObject("too short")
+            magic, version, nreg, word, source, size, crc = header.unpack_from(data)
+            if magic != MAGIC:
+                raise BadObject("not an object file")
+            if version != VERSION:
+                raise BadObject("version %d, not %d" % (version, VERSION))
+            if len(data) != header.size + size or \
+               zlib.crc32(data[header.size:]) & 0xffffffff != crc:
+                raise BadObject("damaged")
+            if nreg != vpu.nreg or word != (vpu.word or 0):
+                raise BadObject("made for another processor")
+            if text != None and source != digest(text) and source != NODIGEST:
+                raise BadObject("stale")
+            read(vpu, Reader(data, header.size))
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+    finally:
+        file.close()
+
+def read(vpu, reader):
+    ops = reader.names()
+    stream = reader.numbers()
+    Prog = Program()
+    p = 0
+    try:
+        while p < len(stream):
+            name = ops[stream[p]]
+            n = len(opcodes[name])
+            Prog.append((name,) + stream[p+1:p+1+n])
+            p = p + 1 + n
+    except (IndexError, KeyError):
+        raise BadObject("damaged")
+    lines = list(reader.numbers())
+    StaticMem, = reader.numbers()
+    RAM = reader.numbers()
+    vpu.clean()
+    vpu.Prog = Prog
+    vpu.lines = lines
+    vpu.StaticMem = StaticMem
+    vpu.RAM.extend(RAM)
+    vpu.RAM.extend(vpu.words(vpu.RAMSize))
+    vpu.labelp = reader.table()
+    vpu.labelm = reader.table()
+    vpu.labelms = reader.table()
+    vpu.constants = reader.table()
+    labels = reader.names()
+    vpu.fixups = zip(reader.numbers(), reader.numbers(), labels)
+    vpu.reg[vpu.SPn] = vpu.StaticMem
+    vpu.reg[vpu.FPn] = vpu.reg[vpu.SPn] + 1
+    vpu.link()
+
+if __name__ == '__main__':
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "n:w:o:")
+    except getopt.GetoptError:
+        args = []
+    if len(args) != 1:
+        sys.stderr.write("Usage: vpu_object.py [-n registers] [-w word] "
+                         "[-o object] program.apoo\n")
+        sys.exit(2)
+    options = {}
+    output = os.path.splitext(args[0])[0] + ".apob"
+    for o, v in opts:
+        if o == '-n': options['n'] = int(v)
+        elif o == '-w': options['word'] = int(v)
+        elif o == '-o': output = v
+    vpu = Vpu(**options)
+    try:
+        vpu.load(ReadProgram(args[0]))
+    except vpuLoadError, error:
+        sys.stderr.write("%s: %s in line %d\n" % (args[0], error.message, error.line))
+        sys.exit(1)
+    try:
+        dump(vpu, output, open(args[0]).read())
+    except BadObject, error:
+        sys.stderr.write("%s: %s\n" % (args[0], error.message))
+        sys.exit(1)
@@ -0,0 +1,407 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Instruction profiler for the Apoo Virtual Processor
+
+Copyright (C) 1998-2006 Rogério Reis & Nelma Moreira {rvr,nam}@ncc.up.pt
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+Counts how many times each instruction is executed, where every
+control transfer went and how many times each memory address is read
+and written.  Single steps are counted by wrapping the linked
+instructions; the block tier counts whole blocks, (first address,
+size, next address) at a time, which are only spread over the
+instructions when the results are asked for.  Nothing of this is
+installed while the profiler is off.
+
+The CallStack follows jsr and rtn to know, at every moment, which
+subroutines are running, named after the label of their first
+instruction.  It counts the steps spent in each path of calls and
+keeps the return addresses, so errors can tell where they happened.
+"""
+from functools import partial
+from constants import operands, vpuError
+from vpu_blocks import branch
+import string
+
+# conditional jumps, whose second operand is the target
+conditional = ['jneg', 'jpos', 'jnzero', 'jzero']
+# the transfers that can close a loop (jsr does not)
+jumps = conditional + ['jump', 'jumpi']
+
+
+class Profiler:
+    def __init__(self, vpu):
+        """Profiles vpu from now on; see Vpu.profile."""
+        self.vpu = vpu
+        self.clear()
+        self.reset()
+        self.load, self.store = vpu.MLoad, vpu.MStore
+        self.push, self.pop = vpu.push, vpu.pop
+        vpu.MLoad, vpu.MStore = self.MLoad, self.MStore
+        vpu.push, vpu.pop = self.Push, self.Pop
+
+    def clear(self):
+        """Forgets everything counted so far."""
+        self.counts = [0] * len(self.vpu.Prog)
+        self.edges = {}
+        self.spans = {}
+        self.reads = {}
+        self.writes = {}
+
+    def reset(self):
+        """Wraps the linked program; must be called whenever the
+        program is (re)linked. The counts are kept unless the program
+        has changed size."""
+        vpu = self.vpu
+        if len(self.counts) != len(vpu.Prog):
+            self.clear()
+        self.ops = vpu.ops
+        ops = []
+        for pc in range(len(vpu.ops)):
+            if branch.has_key(vpu.Prog.name(pc)):
+                ops.append(partial(self.transfer, pc))
+            else:
+                ops.append(partial(self.step, pc))
+        vpu.ops = ops
+
+    def detach(self):
+        """Removes the memory counters from the processor."""
+        for name in ['MLoad', 'MStore', 'push', 'pop']:
+            del self.vpu.__dict__[name]
+
+    # counters
+    def step(self, pc):
+        self.counts[pc] = self.counts[pc] + 1
+        self.ops[pc]()
+
+    def transfer(self, pc):
+        self.counts[pc] = self.counts[pc] + 1
+        self.ops[pc]()
+        key = (pc, self.vpu.PC)
+        self.edges[key] = self.edges.get(key, 0) + 1
+
+    def count(self, start, end):
+        """Counts the instructions from start to end, a block the tier
+        left in the middle because of an exception."""
+        for pc in range(start, end + 1):
+            self.counts[pc] = self.counts[pc] + 1
+
+    def MLoad(self, add):
+        self.reads[add] = self.reads.get(add, 0) + 1
+        return self.load(add)
+
+    def MStore(self, add, val):
+        self.writes[add] = self.writes.get(add, 0) + 1
+        self.store(add, val)
+
+    def Push(self, val):
+        vpu = self.vpu
+        sp = vpu.reg[vpu.SPn] + 1
+        if 0 <= sp < vpu.ramTop:    # otherwise MStore counts it
+            self.writes[sp] = self.writes.get(sp, 0) + 1
+        self.push(val)
+
+    def Pop(self):
+        vpu = self.vpu
+        sp = vpu.reg[vpu.SPn]
+        if 0 <= sp < vpu.ramTop and sp > vpu.StaticMem:
+            self.reads[sp] = self.reads.get(sp, 0) + 1
+        return self.pop()
+
+    def collect(self):
+        """Spreads the blocks counted by the tier over their
+        instructions and control transfers."""
+        counts, edges = self.counts, self.edges
+        for (start, n, next), times in self.spans.items():
+            for pc in range(start, start + n):
+                counts[pc] = counts[pc] + times
+            key = (start + n - 1, next)
+            edges[key] = edges.get(key, 0) + times
+        self.spans = {}
+
+    # results
+    def line(self, pc):
+        try: return self.vpu.lines[pc]
+        except IndexError: return 0
+
+    def hotLines(self, n=10):
+        """Returns the n most executed instructions as (count, line,
+        address) tuples."""
+        self.collect()
+        hot = []
+        for pc in range(len(self.counts)):
+            if self.counts[pc]:
+                hot.append((self.counts[pc], self.line(pc), pc))
+        hot.sort()
+        hot.reverse()
+        return hot[:n]
+
+    def branches(self):
+        """Returns a dictionary with (taken, not taken) counts for
+        every conditional jump executed."""
+        self.collect()
+        result = {}
+        for (pc, next), times in self.edges.items():
+            i = self.vpu.Prog[pc]
+            if i[0] in conditional:
+                taken, not_taken = result.get(pc, (0, 0))
+                if next == i[2]:
+                    taken = taken + times
+                else:
+                    not_taken = not_taken + times
+                result[pc] = (taken, not_taken)
+        return result
+
+    def loops(self, n=10):
+        """Returns the n most repeated loops, found from the jumps
+        backwards, as (iterations, first address, last address)."""
+        self.collect()
+        loops = {}
+        for (pc, next), times in self.edges.items():
+            if 0 <= next <= pc and self.vpu.Prog.name(pc) in jumps:
+                loops[(next, pc)] = loops.get((next, pc), 0) + times
+        result = [(times, first, last) for (first, last), times in loops.items()]
+        result.sort()
+        result.reverse()
+        return result[:n]
+
+    def opcodes(self):
+        """Returns a dictionary with how many times each opcode was
+        executed."""
+        self.collect()
+        result = {}
+        for pc in range(len(self.counts)):
+            if self.counts[pc]:
+                op = self.vpu.Prog.name(pc)
+                result[op] = result.get(op, 0) + self.counts[pc]
+        return result
+
+    def report(self, n=10):
+        """Returns the results as text."""
+        self.collect()
+        out = ["Instructions executed: %d" % reduce(lambda a, b: a + b, self.counts, 0),
+               "", "Hottest lines:"]
+        for times, line, pc in self.hotLines(n):
+            out.append("%10d  line %-5d %s" % (times, line, instruction(self.vpu.Prog[pc])))
+        out.append("")
+        out.append("Hottest loops:")
+        for times, first, last in self.loops(n):
+            out.append("%10d  lines %d-%d" % (times, self.line(first), self.line(last)))
+        out.append("")
+        out.append("Conditional jumps (taken/not taken):")
+        branches = self.branches().items()
+        branches.sort()
+        for pc, (taken, not_taken) in branches:
+            out.append("%10d/%-10d line %-5d %s" % (taken, not_taken, self.line(pc),
+                                                   instruction(self.vpu.Prog[pc])))
+        out.append("")
+        out.append("Opcodes:")
+        ops = [(times, op) for op, times in self.opcodes().items()]
+        ops.sort()
+        ops.reverse()
+        for times, op in ops:
+            out.append("%10d  %s" % (times, op))
+        for title, table in [("Memory reads:", self.reads), ("Memory writes:", self.writes)]:
+            out.append("")
+            out.append(title)
+            hot = [(times, add) for add, times in table.items()]
+            hot.sort()
+            hot.reverse()
+            for times, add in hot[:n]:
+                out.append("%10d  address %d" % (times, add))
+        return string.join(out, "\n") + "\n"
+
+def instruction(i):
+    """Returns the text of a linked instruction."""
+    words = [i[0]]
+    for k in range(1, len(i)):
+        if operands[i[0]][k-1] == 'r':
+            words.append("R%d" % i[k])
+        else:
+            words.append(str(i[k]))
+    return string.join(words, " ")
+
+
+class CallNode:
+    """A path of calls: the subroutine name, the node of its caller,
+    the nodes of the subroutines it called, how many times it was
+    entered and the steps executed while it was the innermost one."""
+    def __init__(self, name, parent):
+        self.name = name
+        self.parent = parent
+        self.children = {}
+        self.calls = 0
+        self.steps = 0
+
+    def total(self):
+        """Steps executed in this path and in all the calls it made."""
+        total = self.steps
+        for child in self.children.values():
+            total = total + child.total()
+        return total
+
+
+class CallStack:
+    def __init__(self, vpu):
+        """Follows the subroutine calls of vpu from now on; see
+        Vpu.trackCalls."""
+        self.vpu = vpu
+        self.root = CallNode("<main>", None)
+        self.frame = (self.root, None, None)
+        self.maxDepth = {}
+        self.now = self.last = 0
+        self.unwind()
+        self.reset()
+
+    def unwind(self):
+        """Empties the stack, as when the program is started again."""
+        self.flush()
+        self.frame = (self.root, None, None)
+        self.depth = {}
+
+    def reset(self):
+        """Wraps the linked program; must be called whenever the
+        program is (re)linked."""
+        vpu = self.vpu
+        self.names = {}
+        labels = vpu.labelp.keys()
+        labels.sort()
+        for label in labels:
+            self.names.setdefault(vpu.labelp[label], label)
+        self.ops = vpu.ops
+        wrappers = {'jsr':self.call, 'rtn':self.ret}
+        vpu.ops = [partial(wrappers.get(vpu.Prog.name(pc), self.step), pc)
+                   for pc in range(len(vpu.ops))]
+
+    def flush(self):
+        node = self.frame[0]
+        node.steps = node.steps + self.now - self.last
+        self.last = self.now
+
+    # wrappers.  A frame is (node, address of the jsr, caller's
+    # frame), so that keeping one costs the same at any depth.
+    def step(self, pc):
+        self.now = self.now + 1
+        try: self.ops[pc]()
+        except vpuError, error:
+            error.frame = self.frame
+            raise
+
+    def call(self, pc):
+        self.now = self.now + 1
+        try: self.ops[pc]()
+        except vpuError, error:
+            error.frame = self.frame
+            raise
+        self.flush()
+        target = self.vpu.PC
+        name = self.names.get(target, "@%d" % target)
+        parent = self.frame[0]
+        try: node = parent.children[name]
+        except KeyError:
+            node = parent.children[name] = CallNode(name, parent)
+        node.calls = node.calls + 1
+        self.frame = (node, pc, self.frame)
+        depth = self.depth[name] = self.depth.get(name, 0) + 1
+        if depth > self.maxDepth.get(name, 0):
+            self.maxDepth[name] = depth
+
+    def ret(self, pc):
+        self.now = self.now + 1
+        try: self.ops[pc]()
+        except vpuError, error:
+            error.frame = self.frame
+            raise
+        # a subroutine may also return to an outer caller, dropping
+        # the frames in between; returns with no matching call are
+        # ignored
+        frame = self.frame
+        while frame[1] != None and frame[1] + 1 != self.vpu.PC:
+            frame = frame[2]
+        if frame[1] == None:
+            return
+        self.flush()
+        while self.frame is not frame[2]:
+            name = self.frame[0].name
+            self.depth[name] = self.depth[name] - 1
+            self.frame = self.frame[2]
+
+    # results
+    def backtrace(self, frame=None):
+        """Returns the calls active in frame (by default the current
+        one), outermost first, as (subroutine, line of the call)."""
+        if frame == None:
+            frame = self.frame
+        trace = []
+        while frame[1] != None:
+            trace.append((frame[0].name, self.line(frame[1])))
+            frame = frame[2]
+        trace.reverse()
+        return trace
+
+    def line(self, pc):
+        try: return self.vpu.lines[pc]
+        except IndexError: return 0
+
+    def nodes(self):
+        """Returns (node, names of its callers) for every path."""
+        self.flush()
+        result = []
+        todo = [(self.root, [])]
+        while todo:
+            node, path = todo.pop()
+            result.append((node, path))
+            for child in node.children.values():
+                todo.append((child, path + [node.name]))
+        return result
+
+    def subroutines(self):
+        """Returns a dictionary with (calls, inclusive steps, exclusive
+        steps, maximum recursion depth) for each subroutine. The
+        inclusive steps of recursive calls are only counted once."""
+        result = {}
+        for node, path in self.nodes():
+            calls, inclusive, exclusive, depth = result.get(node.name, (0, 0, 0, 0))
+            if not node.name in path:
+                inclusive = inclusive + node.total()
+            result[node.name] = (calls + node.calls, inclusive,
+                                 exclusive + node.steps,
+                                 self.maxDepth.get(node.name, depth))
+        return result
+
+    def collapsed(self):
+        """Returns the steps of every path of calls in the collapsed
+        stack format read by the flame graph tools."""
+        out = []
+        for node, path in self.nodes():
+            if node.steps:
+                out.append("%s %d" % (string.join(path + [node.name], ";"), node.steps))
+        out.sort()
+        return string.join(out, "\n") + "\n"
+
+    def report(self):
+        """Returns the results as text."""
+        out = ["%-20s %8s %10s %10s %6s" % ("Subroutine", "calls", "inclusive",
+                                             "exclusive", "depth")]
+        subs = []
+        for name, (calls, inclusive, exclusive, depth) in self.subroutines().items():
+            subs.append((inclusive, name, calls, exclusive, depth))
+        subs.sort()
+        subs.reverse()
+        for inclusive, name, calls, exclusive, depth in subs:
+            out.append("%-20s %8d %10d %10d %6d" % (name, calls, inclusive, exclusive, depth))
+        return string.join(out, "\n") + "\n"
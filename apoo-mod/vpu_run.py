@@ -0,0 +1,171 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Command line runner for the Apoo Virtual Processor
+
+Copyright (C) 1998-2006 Rogério Reis & Nelma Moreira {rvr,nam}@ncc.up.pt
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+Runs a program, source or object file, to the end without the
+graphical interface, so it needs no display and imports nothing but
+the processor.  The console devices (see vpu_console) read from stdin
+(or -i) and write to stdout (or -o), at most -l characters if given.
+
+At the end the state of the processor can be dumped (-d), as text or
+as a JSON object, to stderr (or -D): how the program ended, steps,
+seconds, PC and its source line, registers, the memory up to the top
+of the stack and the value at every memory label; a source file that
+does not load also gives the column of the word that is wrong.  The
+exit status is 0 if the program halted, 1 if it did not load or ended
+in error and 2 for a bad command line.
+
+Usage: vpu_run.py [-n registers] [-m memory] [-w 16|32] [-s steps] [-b]
+                  [-i input] [-o output] [-l limit] [-d text|json]
+                  [-D dump] program
+"""
+from constants import *
+from vpu import Vpu, StreamProgram, wordColumn, words
+from vpu_console import Console
+import vpu_object
+import sys, getopt, json, linecache
+
+MAXSTEPS = 1000000
+
+
+def load(vpu, filename):
+    """Loads the object or source file filename in vpu, the source
+    being assembled as it is read"""
+    if vpu_object.isObject(filename):
+        vpu_object.load(vpu, filename)
+        return
+    try:
+        input = open(filename, 'r')
+    except IOError:
+        raise FileError()
+    try:
+        vpu.load(StreamProgram(input))
+    finally:
+        input.close()
+
+def state(vpu, filename, error, line, column=0):
+    """What the dump shows of vpu, which ended with error"""
+    top = max(0, min(vpu.reg[vpu.SPn] + 1, len(vpu.RAM)))
+    labels = {}
+    for name, add in vpu.labelm.items():
+        if 0 <= add < len(vpu.RAM):
+            labels[name] = vpu.RAM[add]
+    return {'file':filename, 'end':error.__class__.__name__,
+            'halted':isinstance(error, EndOfProgram),
+            'message':getattr(error, 'message', str(error)), 'line':line,
+            'column':column,
+            'steps':vpu.steps, 'seconds':vpu.time, 'pc':vpu.PC,
+            'registers':list(vpu.reg), 'memory':list(vpu.RAM[:top]),
+            'labels':labels}
+
+def where(record):
+    """The line and column of record, as far as they are known"""
+    if not record['line']:
+        return ""
+    if not record['column']:
+        return "line %d" % record['line']
+    return "line %(line)d, column %(column)d" % record
+
+def text(record):
+    lines = ["%(file)s: %(message)s after %(steps)d steps (%(seconds).6fs)" % record,
+             "PC %d%s" % (record['pc'], where(record) and " (%s)" % where(record))]
+    lines.append(" ".join(["R%d %d" % (k, record['registers'][k])
+                           for k in range(len(record['registers']))]))
+    memory = record['memory']
+    for add in range(0, len(memory), 8):
+        lines.append("%6d: %s" % (add, " ".join(["%d" % v for v in memory[add:add+8]])))
+    for name in sorted(record['labels'].keys()):
+        lines.append("%s = %d" % (name, record['labels'][name]))
+    return "\n".join(lines) + "\n"
+
+def main(filename, n=8, RAMSize=1000, word=None, MaxSteps=MAXSTEPS, blocks=False,
+         input=sys.stdin, output=sys.stdout, limit=None, dump=None,
+         dumpFile=sys.stderr):
+    """Runs the program in filename to the end and returns the exit
+    status"""
+    vpu = Vpu(n, {}, None, RAMSize, word)
+    console = Console(input, output, limit)
+    console.map(vpu)
+    line = column = 0
+    loaded = False
+    try:
+        try:
+            load(vpu, filename)
+            loaded = True
+            vpu.useBlocks(blocks)
+            vpu.run(MaxSteps)
+        finally:
+            console.flush()
+    except (vpuError, ArithmeticError), error:
+        if hasattr(error, 'line'):
+            line = error.line
+            if not loaded:
+                column = wordColumn(linecache.getline(filename, line), error)
+        elif loaded and 0 <= vpu.PC < len(vpu.lines):
+            # where the program was running
+            line = vpu.lines[vpu.PC]
+    record = state(vpu, filename, error, line, column)
+    if dump == 'json':
+        dumpFile.write(json.dumps(record, sort_keys=True) + "\n")
+    elif dump == 'text':
+        dumpFile.write(text(record))
+    elif not record['halted']:
+        sys.stderr.write("%s: %s%s\n" % (filename, record['message'],
+                                         line and " in %s" % where(record) or ""))
+    if record['halted']:
+        return 0
+    return 1
+
+def usage():
+    sys.stderr.write("Usage: vpu_run.py [-n registers] [-m memory] [-w 16|32] "
+                     "[-s steps] [-b] [-i input] [-o output] [-l limit] "
+                     "[-d text|json] [-D dump] program\n")
+    sys.exit(2)
+
+if __name__ == '__main__':
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "n:m:w:s:bi:o:l:d:D:")
+    except getopt.GetoptError:
+        usage()
+    if len(args) != 1:
+        usage()
+    options = {}
+    try:
+        for o, v in opts:
+            if o == '-n': options['n'] = int(v)
+            elif o == '-m': options['RAMSize'] = int(v)
+            elif o == '-w': options['word'] = int(v)
+            elif o == '-s': options['MaxSteps'] = int(v) or sys.maxint
+            elif o == '-l': options['limit'] = int(v)
+            elif o == '-d': options['dump'] = v
+    except ValueError:
+        usage()
+    # RS and RF are the last two registers
+    if (options.get('n', 2) < 2 or options.get('RAMSize', 0) < 0
+        or options.get('word') not in words
+        or options.get('MaxSteps', 0) < 0 or options.get('limit', 0) < 0
+        or options.get('dump') not in (None, 'text', 'json')):
+        usage()
+    for o, v in opts:
+        if o == '-b': options['blocks'] = True
+        elif o == '-i': options['input'] = open(v, 'r')
+        elif o == '-o': options['output'] = open(v, 'w')
+        elif o == '-D': options['dumpFile'] = open(v, 'w')
+    sys.exit(main(args[0], **options))
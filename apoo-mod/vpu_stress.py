@@ -0,0 +1,121 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Thread stress check for the Apoo Virtual Processor
+
+Copyright (C) 1998-2006 Rogério Reis & Nelma Moreira {rvr,nam}@ncc.up.pt
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+Runs every given program once on its own to get the expected
+results and then many times over in parallel threads, each thread
+with its own processors, in all the execution modes (step, advance,
+run with and without blocks, bounded words).  Every run must give
+exactly the same registers, memory, step count, end condition and,
+when stepping, the same list of memory writes as the serial one.
+
+Usage: vpu_stress.py [-t threads] [-r rounds] program.apoo ...
+"""
+from vpu import Vpu, ReadProgram
+import sys, getopt, threading
+
+MAXSTEPS = 20000
+modes = [('step', None), ('advance', None), ('run', None), ('blocks', None),
+         ('blocks', 16), ('step', 32)]
+
+def execute(program, mode, word):
+    """Loads program in a fresh processor and runs it to the end in
+    the given mode. Returns what must not depend on other threads."""
+    vpu = Vpu(word=word)
+    writes = []
+    try:
+        vpu.load(program)
+        if mode == 'step':
+            while vpu.steps <= MAXSTEPS:
+                writes.append(vpu.step())
+            error = 'TooManySteps'
+        elif mode == 'advance':
+            journal = vpu.advance(-1, False, MAXSTEPS)
+            writes = journal.mem.items()
+            writes.sort()
+            error = journal.error and journal.error.__class__.__name__
+        else:
+            vpu.useBlocks(mode == 'blocks')
+            vpu.run(MAXSTEPS)
+            error = None
+    except Exception, e:
+        error = e.__class__.__name__
+    return (list(vpu.reg), list(vpu.RAM), vpu.PC, vpu.steps, error, writes)
+
+class Worker(threading.Thread):
+    def __init__(self, jobs, order, expected, rounds):
+        threading.Thread.__init__(self)
+        self.jobs = jobs
+        self.order = order
+        self.expected = expected
+        self.rounds = rounds
+        self.failures = []
+
+    def run(self):
+        for n in range(self.rounds):
+            for i in self.order:
+                if execute(*self.jobs[i]) != self.expected[i]:
+                    self.failures.append(i)
+
+def main(files, threads=16, rounds=5):
+    jobs = []
+    for name in files:
+        program = ReadProgram(name)
+        for mode, word in modes:
+            jobs.append((program, mode, word))
+    expected = []
+    names = []
+    for i in range(len(jobs)):
+        expected.append(execute(*jobs[i]))
+        names.append("%s %s %s" % (files[i / len(modes)], jobs[i][1], jobs[i][2]))
+    sys.setcheckinterval(1)
+    workers = []
+    for i in range(threads):
+        # every thread goes through the jobs in a different order
+        k = i % len(jobs)
+        order = range(k, len(jobs)) + range(k)
+        workers.append(Worker(jobs, order, expected, rounds))
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    failed = 0
+    for w in workers:
+        for i in w.failures:
+            sys.stderr.write("%s: %s\n" % (w.getName(), names[i]))
+            failed = failed + 1
+    print "%d threads x %d rounds x %d runs: %d failed" % (threads, rounds,
+                                                           len(jobs), failed)
+    return failed
+
+if __name__ == '__main__':
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "t:r:")
+    except getopt.GetoptError:
+        args = []
+    if not args:
+        sys.stderr.write("Usage: vpu_stress.py [-t threads] [-r rounds] "
+                         "program.apoo ...\n")
+        sys.exit(2)
+    options = {}
+    for o, v in opts:
+        options[{'-t':'threads', '-r':'rounds'}[o]] = int(v)
+    if main(args, **options):
+        sys.exit(1)
@@ -22,170 +22,206 @@ Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
 """
 
 from constants import *
-from vpu import Vpu, ReadProgram, CantRead, isNumber, isRegName
+from vpu import Vpu, ParseProgram, isRegName
+from vpu_cache import ImageCache
+from vpu_console import Console, LIMIT
+import vpu_object
 import constants, vpu
 # constants need to be imported twice because of -v option...
-import sys, stat, posix, string
+import sys, os, stat, posix, string, hashlib, tempfile, cPickle
 
 __version =  "$Id: vpu_tutor.py,v 1.29 2006-11-13 11:11:59 rvr Exp $"
 
-class Vpu_Tutor(Vpu):
-    def doIt(self):
+class TutorResult:
+    """What grading a program gave:
+
+    grade    -- the points awarded
+    passed   -- True if the tutor reached its end with no errors
+    output   -- what the command line tester writes on stdout
+    errors   -- what it writes on stderr (errors in the tutor file or
+                files that cannot be read)
+    code     -- its exit status
+    blocks   -- one (command, points, awarded, message) per value
+                block graded, command being load, initial, exec, final
+                or +final
+    messages -- the error messages, in the order they were found
+    steps    -- the instructions executed, over all the exec blocks"""
+    def __init__(self):
+        self.grade = 0
+        self.passed = False
+        self.output = ""
+        self.errors = ""
+        self.code = 0
+        self.blocks = []
+        self.messages = []
+        self.steps = 0
+
+class Finish(Exception):
+    """Ends the grading, with code as exit status"""
+    def __init__(self, code=0):
+        Exception.__init__(self, code)
+        self.code = code
+
+def lines(source):
+    """Returns the lines of source, a file name or an iterable of
+    lines (an open file, a list, a StringIO...)"""
+    if isinstance(source, basestring):
         try:
-            input = open(self.tutorFile,'r')
+            input = open(source, 'r')
         except IOError:
-            CantRead(self.tutorFile)
+            return None
+        try:
+            return input.readlines()
+        finally:
+            input.close()
+    return list(source)
+
+# programs assembled, by their text: the same submission is often
+# graded many times over
+images = ImageCache()
+
+def grade(tutor, program, MaxSteps=1000, cache=None):
+    """Grades program following tutor and returns a TutorResult. Each
+    one can be a file name or an iterable of lines; to grade a source
+    text, give text.splitlines(True) or a StringIO. program can also be
+    the name of an object file (see vpu_object). tutor can also be
+    a TutorSpec (see compileTutor). MaxSteps bounds every exec
+    block. cache is the ImageCache to use instead of images."""
+    return Vpu_Tutor().check(tutor, program, MaxSteps, cache)
+
+class Vpu_Tutor(Vpu):
+    def doIt(self):
+        """The command line tester: grades programFile following
+        tutorFile, writes the result and exits with its code"""
+        result = self.check(self.tutorFile, self.programFile)
+        sys.stdout.write(result.output)
+        sys.stderr.write(result.errors)
+        sys.exit(result.code)
+
+    def check(self, tutor, program, MaxSteps=1000, cache=None):
+        """Grades program following tutor (a TutorSpec, a file name or
+        an iterable of lines) and returns a TutorResult"""
+        self.result = result = TutorResult()
+        self.MaxSteps = MaxSteps
+        if cache == None:
+            cache = images
+        self.images = cache
         self.ggrade = 0
-        last, loaded, run = 'ready',0,0
-        tutor = []
-        # remove commands and create a tutor command list
-        while 1:
-            line = input.readline()
-            if not line: break
-            if len(line) == 1: continue
-            line = string.split(line)
-            if line:
-                if line[0][0] == '#':
-                    continue
-                flag = 1
-                for i in range(len(line)):
-                    if line[i][0] != '#' and flag:
-                        continue
-                    else:
-                        flag = 0
-                        del(line[i])
-            tutor.append(line)
-        # now lets parse and execute the tutor file
-        for line in tutor:
-            if not line:
-                continue
-            if line[0] == 'load':
-                if last != 'ready':
-                    sys.stderr.write("error: load out of order\n")
-                    sys.exit(1)
-                last = 'load'
-                run = 0
-            elif line[0] == 'initial':
-                if last != 'ready' or not loaded:
-                    sys.stderr.write("error: initial out of order\n")
-                    sys.exit(1)
-                last = line[0]
-                run = 0
-                labelReq1 = {}
-                labelReq2 = {}
-                for arg in line[1:]:
-                    if ':' in arg:
-                        a = string.split(arg,':')
-                        labelReq1[a[0]] = ParseValuesM(a[1])
-                    elif ';' in arg:
-                        a = string.split(arg,';')
-                        labelReq2[a[0]] = int(a[1])
-                    else:
-                        sys.stderr.write("error: bad arguments for initial\n")
-                        sys.exit(1)
-            elif line[0] == 'init':
-                if last == 'load':
-                    sys.stdout.write("error: Not testing the initial set of values\n")
-                    sys.exit(1)
-                elif not loaded:
-                    sys.stdout.write("error: program not loaded\n")
-                    sys.exit(1)
-                else:
-                    self.load(program)
-                    for arg in line[1:]:
-                        foo = string.split(arg,':')
-                        if isRegName(foo[0]):
-                            bar = int(foo[0][1:])
-                            self.reg[bar] = int(foo[1])
-                        else:
-                            self.VerifyLabelM(foo[0])
-                            Values = ParseValuesM(foo[1])
-                            # lets verify if the values fit
-                            # in the originally allocated space
-                            if len(Values) > self.labelms[foo[0]]:
-                                self.reserveMemory(foo[0],len(Values))
-                            add = self.labelm[foo[0]]
-                            for i in Values:
-                                self.RAM[add] = i
-                                add = add + 1
-                last = line[0]
-                run = 0
-            elif line[0] == 'exec':
-                if not loaded:
-                    sys.stdout.write("error: program not loaded\n")
-                    sys.exit(1)
+        self.block = None
+        # programs read what input commands give and write to nowhere
+        self.console = Console(limit=LIMIT)
+        self.console.map(self)
+        if hasattr(self, 'ErrMessage'):
+            del self.ErrMessage
+        try:
+            if not isinstance(tutor, TutorSpec):
+                source = lines(tutor)
+                if source == None:
+                    self.cantRead(tutor)
+                tutor = compileTutor(source)
+            self.execute(tutor, program)
+        except Finish, finish:
+            result.code = finish.code
+        result.grade = self.ggrade
+        return result
+
+    def execute(self, spec, program):
+        self.useBlocks()
+        # stop looping submissions at once, not after MaxSteps
+        self.detectLoops()
+        for linum, command, args in spec.commands:
+            if command == 'error':
+                message, code = args
+                if code:
+                    self.error(message)
                 else:
-                    if len(line) == 1:
-                        target = ""
+                    self.stop(message, 1)
+            elif command == 'input':
+                self.console.reset(args)
+            elif command == 'init':
+                self.restore(image)
+                for name, values in args:
+                    if isRegName(name):
+                        self.reg[int(name[1:])] = values
                     else:
-                        target = line[1]
-                    run = 1
-                    last = line[0]
-            elif line[0] == 'final' or line[0] == '+final':
-                last = line[0]
-                if not run:
-                    sys.stdout.write("error: need to run the program before testing the results\n")
-                    sys.exit(1)
-                RegVal = {}
-                LabelReq1 = {}
-                for arg in line[1:]:
-                    foo = string.split(arg,':')
-                    if isRegName(foo[0]):
-                        RegVal[int(foo[0][1:])] = int(foo[1])
-                    else:
-                        LabelReq1[foo[0]] = ParseValuesM(foo[1])
-            elif line[0] == 'end':
+                        self.VerifyLabelM(name)
+                        # lets verify if the values fit
+                        # in the originally allocated space
+                        if len(values) > self.labelms[name]:
+                            self.reserveMemory(name,len(values))
+                        self.write(self.labelm[name], values)
+            elif command == 'end':
                 if self.NoErrorsp():
-                    sys.stdout.write("%d OK\n"%self.ggrade)
+                    self.result.passed = True
+                    self.stop("%d OK\n"%self.ggrade)
                 else:
-                    sys.stdout.write("%d %s"%(self.ggrade,self.ErrMessage))
-                sys.exit(0)
-            elif line[0] == 'value':
-                grade = int(line[1])
-                if not last in ['load','initial','exec','final','+final']:
-                    sys.stderr.write("error: value out of order\n")
-                    sys.exit(1)
-                elif last == 'load':
-                    program = ReadProgram(self.programFile)
+                    self.stop("%d %s"%(self.ggrade,self.ErrMessage))
+            elif command == 'value':
+                grade, last, args = args
+                self.block = (last, grade)
+                if last == 'load':
+                    if isinstance(program, basestring) and vpu_object.isObject(program):
+                        load = lambda: vpu_object.load(self, program)
+                    else:
+                        source = lines(program)
+                        if source == None:
+                            self.cantRead(program)
+                        load = lambda: self.images.load(self, string.join(source, ""),
+                                                        lambda: ParseProgram(source))
                     try:
-                        self.load(program)
+                        load()
                     except vpuError, obj:
                         self.respond(obj.message,obj.line)
-                    loaded = 1
-                    self.ggrade = self.ggrade + grade
-                    last = 'ready'
+                    # every init starts again from the loaded image
+                    image = self.snapshot()
+                    self.award(grade)
                 elif last == 'initial':
+                    labelReq1, labelReq2 = args
                     for l in labelReq1.keys():
                         self.VerifyLabel1(l,labelReq1[l])
                     for l in labelReq2.keys():
                         self.VerifyLabel2(l,labelReq2[l])
-                    self.ggrade = self.ggrade + grade
+                    self.award(grade)
                 elif last == 'exec':
-                    if target == "":
+                    if args == "":
+                        steps = self.steps
                         try:
-                            self.run()
+                            try:
+                                self.run(self.MaxSteps)
+                            finally:
+                                self.result.steps = self.result.steps + self.steps - steps
                         except EndOfProgram:
-                            self.ggrade = self.ggrade + grade
+                            self.award(grade)
                         except ArithmeticError:
                             self.respond(sys.exc_type)
                         except vpuError, obj:
                             self.respond(obj.message)
-                        except: # this should NEVER happen!
-                            print sys.exc_type, sys.exc_value 
+                        except MemoryError:
+                            raise
+                        # the batch grader's Timeout is not an Exception
+                        except Exception: # this should NEVER happen!
+                            self.result.output = self.result.output + \
+                                "%s %s\n" % (sys.exc_type, sys.exc_value)
+                            self.refuse("%s" % sys.exc_value)
                 elif last == 'final':
+                    RegVal, LabelReq1 = args
                     for r in RegVal.keys():
                         self.VerifyReg(r,RegVal[r])
                     for r in LabelReq1.keys():
                         self.VerifyLabel1(r,LabelReq1[r])
-                    self.ggrade = self.ggrade + grade
+                    self.award(grade)
                 elif last == '+final':
+                    RegVal, LabelReq1 = args
+                    first = len(self.result.messages)
                     nErrors = 0
                     for r in RegVal.keys():
                         nErrors = nErrors + self.VerifyReg(r,RegVal[r],True)
                     for r in LabelReq1.keys():
                         nErrors = nErrors + self.VerifyLabel1(r,LabelReq1[r],True)
                     if not nErrors:
-                        self.ggrade = self.ggrade + grade
+                        self.award(grade)
+                    else:
+                        self.refuse(self.result.messages[first])
 
     def VerifyReg(self, r, value, NotVital=False):
         if self.reg[r] != value:
@@ -193,15 +229,13 @@ class Vpu_Tutor(Vpu):
                 self.SetErrMsg("Register R%d does not have the right value\n"%r)
                 return 1
             else:
-                sys.stdout.write("%d Register R%d does not have the right value\n"%(self.ggrade,r))
-                sys.exit(0)
+                self.fail("Register R%d does not have the right value"%r)
         else:
             return 0
         
     def VerifyLabelM(self,label):
         if not label in self.labelm.keys():
-            sys.stdout.write("%d Label %s not created\n"%(self.ggrade,label))
-            sys.exit(0)
+            self.fail("Label %s not created"%label)
                     
     def VerifyLabel1(self, label, values, NotVital=False):
         self.VerifyLabelM(label)
@@ -215,16 +249,14 @@ class Vpu_Tutor(Vpu):
                     self.SetErrMsg("Label %s does not have the right value\n"%label)
                     return 1
                 else:
-                    sys.stdout.write("%d Label %s does not have the right value\n"%(self.ggrade,label))
-                    sys.exit(0)
+                    self.fail("Label %s does not have the right value"%label)
             add = add + 1
         return 0
     
     def VerifyLabel2(self, label, size):
         self.VerifyLabelM(label)
         if self.labelms[label] != size:
-            sys.stdout.write("%d Label %s does not have the right size assigned\n"%(self.ggrade,label))
-            sys.exit(0)
+            self.fail("Label %s does not have the right size assigned"%label)
 
     def NoErrorsp(self):
         try:
@@ -234,6 +266,7 @@ class Vpu_Tutor(Vpu):
         return False
     
     def SetErrMsg(self,msg):
+        self.result.messages.append(string.rstrip(msg))
         try:
             foo = self.ErrMessage
         except AttributeError:
@@ -241,12 +274,218 @@ class Vpu_Tutor(Vpu):
 
     def respond(self,message,line=0):
         if line != 0:
-            sys.stdout.write("%d %s in line %d\n"%(self.ggrade,message,line))
-            sys.exit(0)
+            self.fail("%s in line %d"%(message,line))
         else:
-            sys.stdout.write("%d %s\n"%(self.ggrade,message))
-            sys.exit(0)
-            
+            self.fail("%s"%message)
+
+    def award(self, points):
+        """The value block being graded gets its points"""
+        self.ggrade = self.ggrade + points
+        command, points = self.block
+        self.result.blocks.append((command, points, True, None))
+        self.block = None
+
+    def refuse(self, message):
+        """The value block being graded gets no points"""
+        command, points = self.block
+        self.result.blocks.append((command, points, False, message))
+        self.block = None
+
+    def fail(self, message):
+        """Ends the grading with the grade so far and message"""
+        self.result.messages.append(message)
+        if self.block != None:
+            self.refuse(message)
+        self.stop("%d %s\n"%(self.ggrade,message))
+
+    def stop(self, output, code=0):
+        if code:
+            self.result.messages.append(string.rstrip(output))
+        self.result.output = self.result.output + output
+        raise Finish(code)
+
+    def error(self, message):
+        """Ends the grading because of an error in the tutor file"""
+        self.result.messages.append(string.rstrip(message))
+        self.result.errors = self.result.errors + message
+        raise Finish(1)
+
+    def cantRead(self, file):
+        self.error("Error: Cannot read file %s\n"%file)
+
+class TutorSpec:
+    """A tutor file checked and parsed once, to grade any number of
+    programs. commands is a list of (line, command, arguments) with
+    the arguments already converted, where each value command carries
+    the block it grades; a command that is out of order or malformed
+    becomes an error command, so that grading still stops where it
+    always did. errors has all of these, with their line numbers."""
+    def __init__(self, digest):
+        self.digest = digest
+        self.version = SPEC_VERSION
+        self.commands = []
+        self.errors = []
+
+    def fail(self, linum, message, code=1):
+        """Notes an error in line linum: code 1 ends grading writing
+        message on stderr, code 0 on stdout"""
+        self.commands.append((linum, 'error', (message, code)))
+        self.errors.append("line %d: %s" % (linum, string.rstrip(message)))
+
+SPEC_VERSION = 2
+# compiled specs by digest, so that a process compiles each tutor once;
+# threads can share it, as it is only read and set item by item (two
+# threads may both compile a tutor new to them, which does no harm)
+specs = {}
+
+def parse(source):
+    """Returns the commands in the lines of a tutor file, without
+    comments, as (line number, words)"""
+    tutor = []
+    linum = 0
+    for line in source:
+        linum = linum + 1
+        if len(line) == 1: continue
+        line = string.split(line)
+        # a word starting with # comments out the rest of the line
+        for i in range(len(line)):
+            if line[i][0] == '#':
+                del line[i:]
+                break
+        if line:
+            tutor.append((linum, line))
+    return tutor
+
+def compileTutor(source, cache=None):
+    """Returns the TutorSpec of source, the lines of a tutor file.
+    Specs are kept by the SHA-1 of the text, in memory and, if cache
+    is a directory, on disk."""
+    source = list(source)
+    digest = hashlib.sha1(string.join(source, "")).hexdigest()
+    spec = specs.get(digest)
+    if spec != None:
+        return spec
+    if cache != None:
+        path = os.path.join(cache, "%s.spec" % digest)
+        try:
+            file = open(path, 'rb')
+            try:
+                spec = cPickle.load(file)
+            finally:
+                file.close()
+            if spec.version != SPEC_VERSION:
+                spec = None
+        except (IOError, EOFError, cPickle.UnpicklingError, AttributeError):
+            spec = None
+    if spec == None:
+        spec = TutorSpec(digest)
+        build(spec, parse(source))
+        if cache != None:
+            # written aside and renamed, for graders sharing the cache
+            fd, temporary = tempfile.mkstemp(".spec", "", cache)
+            file = os.fdopen(fd, 'wb')
+            try:
+                cPickle.dump(spec, file, cPickle.HIGHEST_PROTOCOL)
+            finally:
+                file.close()
+            os.rename(temporary, path)
+    specs[digest] = spec
+    return spec
+
+def build(spec, tutor):
+    """Fills spec with the commands of tutor, following the order the
+    commands must be in as grading would"""
+    last, loaded, run = 'ready',0,0
+    blocks = {}
+    linum = 0
+    for linum, line in tutor:
+        command = line[0]
+        try:
+            if command == 'load':
+                if last != 'ready':
+                    spec.fail(linum, "error: load out of order\n")
+                last = 'load'
+                run = 0
+            elif command == 'initial':
+                if last != 'ready' or not loaded:
+                    spec.fail(linum, "error: initial out of order\n")
+                last = command
+                run = 0
+                labelReq1 = {}
+                labelReq2 = {}
+                for arg in line[1:]:
+                    if ':' in arg:
+                        a = string.split(arg,':')
+                        labelReq1[a[0]] = ParseValuesM(a[1])
+                    elif ';' in arg:
+                        a = string.split(arg,';')
+                        labelReq2[a[0]] = int(a[1])
+                    else:
+                        raise ValueError(arg)
+                blocks[command] = (labelReq1, labelReq2)
+            elif command == 'init':
+                if last == 'load':
+                    spec.fail(linum, "error: Not testing the initial set of values\n", 0)
+                elif not loaded:
+                    spec.fail(linum, "error: program not loaded\n", 0)
+                args = []
+                for arg in line[1:]:
+                    foo = string.split(arg,':')
+                    if isRegName(foo[0]):
+                        args.append((foo[0], int(foo[1])))
+                    else:
+                        args.append((foo[0], ParseValuesM(foo[1])))
+                spec.commands.append((linum, command, args))
+                last = command
+                run = 0
+            elif command == 'input':
+                if not loaded:
+                    spec.fail(linum, "error: program not loaded\n", 0)
+                args = []
+                for arg in line[1:]:
+                    args.extend(ParseValuesM(arg))
+                spec.commands.append((linum, command, args))
+            elif command == 'exec':
+                if not loaded:
+                    spec.fail(linum, "error: program not loaded\n", 0)
+                if len(line) == 1:
+                    blocks[command] = ""
+                else:
+                    blocks[command] = line[1]
+                run = 1
+                last = command
+            elif command == 'final' or command == '+final':
+                last = command
+                if not run:
+                    spec.fail(linum, "error: need to run the program before testing the results\n", 0)
+                RegVal = {}
+                LabelReq1 = {}
+                for arg in line[1:]:
+                    foo = string.split(arg,':')
+                    if isRegName(foo[0]):
+                        RegVal[int(foo[0][1:])] = int(foo[1])
+                    else:
+                        LabelReq1[foo[0]] = ParseValuesM(foo[1])
+                blocks[command] = (RegVal, LabelReq1)
+            elif command == 'end':
+                spec.commands.append((linum, command, None))
+                return
+            elif command == 'value':
+                grade = int(line[1])
+                if not last in ['load','initial','exec','final','+final']:
+                    spec.fail(linum, "error: value out of order\n")
+                else:
+                    spec.commands.append((linum, command,
+                                          (grade, last, blocks.get(last))))
+                    if last == 'load':
+                        loaded = 1
+                        last = 'ready'
+            else:
+                spec.errors.append("line %d: unknown command %s" % (linum, command))
+        except (ValueError, IndexError):
+            spec.fail(linum, "error: bad arguments for %s\n" % command)
+    spec.errors.append("line %d: no end" % (linum + 1))
+
 def ParseValuesM(str):
     l1 = string.split(str,',')
     list = []
@@ -272,18 +511,27 @@ def test(a,b):
     vPu.doIt()
 
 if __name__ == '__main__':
-    if (len(sys.argv) == 2 and sys.argv[1] == "-v"):
+    args = sys.argv[1:]
+    profile = args[:1] == ["-p"]
+    if profile:
+        del args[0]
+    if (len(args) == 1 and args[0] == "-v"):
             sys.stderr.write("%s\n"%__version)
             sys.stderr.write("%s\n"%vpu.__version)
             sys.stderr.write("%s\n"%constants.__version)
             sys.exit(0)
-    elif (len(sys.argv) != 3):
-        sys.stderr.write("Usage: apoo-tutor tutor-file apoo-program\n")
+    elif (len(args) != 2):
+        sys.stderr.write("Usage: apoo-tutor [-p] tutor-file apoo-program\n")
         sys.exit(1)
-    for i in [sys.argv[1],sys.argv[2]]:
+    for i in [args[0],args[1]]:
         readable(i)
     vpu = Vpu_Tutor()
-    vpu.tutorFile = sys.argv[1]
-    vpu.programFile = sys.argv[2]
-    vpu.doIt()
-
+    if profile:
+        vpu.profile()
+    result = vpu.check(args[0], args[1])
+    sys.stdout.write(result.output)
+    sys.stderr.write(result.errors)
+    if profile:
+        sys.stderr.write("%s: " % args[1])
+        sys.stderr.write(vpu.profiler.report())
+    sys.exit(result.code)